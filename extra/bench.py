@@ -0,0 +1,219 @@
+# Microbenchmarks for the Informant hot paths
+#
+#   PYTHONPATH=. python extra/bench.py [-n 100000] [--json out.json]
+#                                      [--compare baseline.json]
+#
+# Reports ns per call and the gc tracked objects each call leaves behind
+# (caches filling up, leaks). Where tracemalloc is available (python 3) the
+# peak number of bytes allocated per call is reported as well.
+import gc
+import json
+import sys
+from optparse import OptionParser
+from timeit import default_timer
+
+from eventlet.green import socket
+from swift.common.swob import Request
+
+from informant.middleware import Informant
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def fake_app(env, start_response):
+    start_response('200 OK', [('Content-Length', '0')])
+    return []
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+def discard_events(payloads, combined_events=False):
+    pass
+
+
+def measure(func, iterations, repeats=3):
+    """
+    Call func iterations times, repeats times over.
+
+    :returns: dict with the best ns per call, the gc tracked objects
+              retained per call and (with tracemalloc) peak bytes per call
+    """
+    func()
+    best = None
+    for i in xrange(repeats):
+        gc.collect()
+        gc.disable()
+        try:
+            start = default_timer()
+            for j in xrange(iterations):
+                func()
+            elapsed = default_timer() - start
+        finally:
+            gc.enable()
+        if best is None or elapsed < best:
+            best = elapsed
+    gc.collect()
+    objects = len(gc.get_objects())
+    for j in xrange(iterations):
+        func()
+    gc.collect()
+    result = {'ns_per_call': best / iterations * 1e9,
+              'objects_per_call':
+              float(len(gc.get_objects()) - objects) / iterations,
+              'peak_bytes_per_call': None}
+    if tracemalloc is not None:
+        tracemalloc.start()
+        calls = min(iterations, 1000)
+        for j in xrange(calls):
+            func()
+        result['peak_bytes_per_call'] = \
+            float(tracemalloc.get_traced_memory()[1]) / calls
+        tracemalloc.stop()
+    return result
+
+
+def wsgi_env(path, method='GET'):
+    return {'REQUEST_METHOD': method, 'PATH_INFO': path,
+            'SCRIPT_NAME': '', 'QUERY_STRING': '',
+            'SERVER_NAME': 'localhost', 'SERVER_PORT': '80',
+            'wsgi.url_scheme': 'http'}
+
+
+def request_func(app, path):
+    """A full request through app, including running its posthooks"""
+    def request():
+        env = wsgi_env(path)
+        env['eventlet.posthooks'] = []
+        app(env, start_response)
+        for hook, args, kwargs in env['eventlet.posthooks']:
+            hook(env, *args, **kwargs)
+    return request
+
+
+def bench_call(iterations):
+    """Informant.__call__ overhead on top of a bare app"""
+    path = '/v1/AUTH_test/cont/obj'
+    results = {}
+    bare = measure(request_func(fake_app, path), iterations)
+    results['call.bare'] = bare
+    for rate in ('0', '0.01', '0.5', '1'):
+        app = Informant(fake_app, {'statsd_sample_rate': rate})
+        app._send_events = discard_events
+        result = measure(request_func(app, path), iterations)
+        result['ns_per_call'] -= bare['ns_per_call']
+        results['call.overhead.rate_%s' % rate] = result
+    return results
+
+
+def bench_statsd_event(iterations):
+    """statsd_event for a mix of stat types and statuses"""
+    results = {}
+    paths = (('acct', '/v1/AUTH_test'), ('cont', '/v1/AUTH_test/cont'),
+             ('obj', '/v1/AUTH_test/cont/obj'),
+             ('healthcheck', '/healthcheck'), ('invalid', '/info'))
+    for prefixed in (False, True):
+        app = Informant(fake_app, {
+            'prefix_accounts': 'AUTH_test' if prefixed else ''})
+        app._send_events = discard_events
+        for stat_type, path in paths:
+            for status in (200, 404, 503):
+                req = Request.blank(path)
+                req.environ['informant.status'] = status
+                req.environ['informant.start_time'] = default_timer()
+                req.environ['informant.start_response_time'] = \
+                    req.environ['informant.start_time']
+                req.environ['informant.sample_rate'] = 0.5
+                req.bytes_transferred = 1024
+
+                def statsd_event(env=req.environ, req=req):
+                    app.statsd_event(env, req)
+                results['statsd_event.%s.%d%s' % (
+                    stat_type, status, '.prefixed' if prefixed else '')] = \
+                    measure(statsd_event, iterations)
+    return results
+
+
+def bench_sampled_event(iterations):
+    """_send_sampled_event with global and per class rates"""
+    results = {}
+    for name, conf in (
+            ('global', {'statsd_sample_rate': '0.01'}),
+            ('class_rates', {'statsd_sample_rate': '0.01',
+                             'class_sample_rates': '5xx:1,obj.GET:0.1'})):
+        app = Informant(fake_app, conf)
+        env = wsgi_env('/v1/AUTH_test/cont/obj')
+
+        def send_sampled_event(app=app, env=env):
+            app._send_sampled_event(env)
+        results['send_sampled_event.%s' % name] = \
+            measure(send_sampled_event, iterations)
+    return results
+
+
+def bench_send_events(iterations):
+    """_send_events of a request's worth of lines to a local udp sink"""
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(('127.0.0.1', 0))
+    host, port = sink.getsockname()
+    results = {}
+    lines = ['obj.GET.200:1|c|@0.5', 'obj.GET.200:12|ms|@0.5',
+             'srt.obj.GET.200:3|ms|@0.5', 'tfer.obj.GET.200:1024|c|@0.5']
+    for combined in (False, True):
+        app = Informant(fake_app, {'statsd_host': host,
+                                   'statsd_port': str(port)})
+
+        def send_events(app=app, combined=combined):
+            app._send_events(lines, combined)
+        results['send_events.%s' % (
+            'combined' if combined else 'uncombined')] = \
+            measure(send_events, iterations)
+    sink.close()
+    return results
+
+
+BENCHMARKS = (bench_call, bench_statsd_event, bench_sampled_event,
+              bench_send_events)
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-n', '--iterations', type='int', default=100000,
+                      help='calls per benchmark (default %default)')
+    parser.add_option('--json', help='save the results to this file')
+    parser.add_option('--compare',
+                      help='show the change from results saved with --json')
+    options, args = parser.parse_args()
+    baseline = {}
+    if options.compare:
+        with open(options.compare) as fp:
+            baseline = json.load(fp)['results']
+    results = {}
+    for benchmark in BENCHMARKS:
+        results.update(benchmark(options.iterations))
+    print '%-40s %10s %10s %10s' % ('benchmark', 'ns/call', 'objs/call',
+                                    'bytes/call')
+    for name in sorted(results):
+        result = results[name]
+        line = '%-40s %10d %10.2f %10s' % (
+            name, result['ns_per_call'], result['objects_per_call'],
+            '-' if result['peak_bytes_per_call'] is None else
+            '%d' % result['peak_bytes_per_call'])
+        if name in baseline and baseline[name]['ns_per_call']:
+            line += ' %+6.1f%%' % (
+                (result['ns_per_call'] - baseline[name]['ns_per_call']) *
+                100.0 / baseline[name]['ns_per_call'])
+        print line
+    if options.json:
+        with open(options.json, 'w') as fp:
+            json.dump({'python': sys.version.split()[0],
+                       'iterations': options.iterations,
+                       'results': results}, fp, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
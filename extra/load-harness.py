@@ -0,0 +1,296 @@
+# End to end load harness for Informant
+#
+# Drives the middleware with many concurrent greenthreads through a fake
+# swift app, while a separate receiver process counts and parses the statsd
+# lines that arrive. Reports packet and line loss, how many requests the
+# sampled counters add up to, throughput and the latency Informant added
+# compared to the same load against the bare app:
+#
+#   PYTHONPATH=. python extra/load-harness.py -c 200 -n 100000 \
+#       -o statsd_sample_rate=0.1 -o combined_events=yes
+#
+# The receiver can also be run by itself as a statsd sink for a real proxy:
+#
+#   python extra/load-harness.py --receive-only --port 8125
+#
+# (pass the proxy's prefix_accounts with -o so its per account counters
+# aren't counted as requests twice)
+import multiprocessing
+import random
+import socket
+import sys
+from optparse import OptionParser
+from time import time
+
+import eventlet
+from eventlet import GreenPool
+
+from informant.middleware import Informant
+
+#: (status, weight) of the responses the fake app returns
+STATUS_MIX = (('200 OK', 80), ('201 Created', 5), ('204 No Content', 3),
+              ('404 Not Found', 8), ('401 Unauthorized', 2),
+              ('503 Service Unavailable', 2))
+#: (path, method, weight) of the requests the harness makes
+REQUEST_MIX = (('/v1/AUTH_%d/cont%d/obj%d', 'GET', 60),
+               ('/v1/AUTH_%d/cont%d/obj%d', 'PUT', 15),
+               ('/v1/AUTH_%d/cont%d/obj%d', 'HEAD', 10),
+               ('/v1/AUTH_%d/cont%d', 'GET', 8),
+               ('/v1/AUTH_%d', 'HEAD', 5),
+               ('/healthcheck', 'GET', 2))
+
+
+def weighted(mix):
+    """Expand a list of (..., weight) into a list to random.choice from"""
+    choices = []
+    for entry in mix:
+        choices.extend([entry[:-1]] * entry[-1])
+    return choices
+
+
+class FakeSwiftApp(object):
+    """
+    Responds after a lognormal latency (with a mean of latency_ms) with a
+    status from STATUS_MIX and a body of a lognormal size (mean of
+    size_bytes) sent in 64KB chunks.
+    """
+
+    def __init__(self, latency_ms, size_bytes, seed=0):
+        self.latency = latency_ms / 1000.0
+        self.size = size_bytes
+        self.statuses = weighted(STATUS_MIX)
+        self.random = random.Random(seed)
+
+    def __call__(self, env, start_response):
+        rand = self.random
+        if self.latency:
+            eventlet.sleep(rand.lognormvariate(0, 0.5) * self.latency)
+        status = rand.choice(self.statuses)[0]
+        size = 0
+        if env['REQUEST_METHOD'] == 'GET' and status.startswith('200'):
+            size = int(rand.lognormvariate(0, 1) * self.size)
+        start_response(status, [('Content-Length', str(size))])
+        return ('x' * min(65536, size - sent)
+                for sent in xrange(0, size, 65536))
+
+
+def parse_line(line):
+    """
+    Parse a statsd line
+
+    :returns: tuple of (name, value, type, sample rate), None if invalid
+    """
+    try:
+        name, rest = line.split(':', 1)
+        parts = rest.split('|')
+        rate = 1.0
+        for part in parts[2:]:
+            if part.startswith('@'):
+                rate = float(part[1:])
+        return name, float(parts[0]), parts[1], rate
+    except (ValueError, IndexError):
+        return None
+
+
+def account_prefixes(conf):
+    """
+    :returns: tuple of the name prefixes of the per account counters of
+              the prefix_accounts in an informant conf
+    """
+    prepend = conf.get('prefix_accounts_metric_prepend', '')
+    return tuple('%s%s.' % (prepend, acct.strip())
+                 for acct in conf.get('prefix_accounts', '').split(',')
+                 if acct.strip())
+
+
+def is_request_counter(name, stat_type, skip_prefixes=()):
+    """
+    Is this a stat_type.METHOD.status request counter, the per account
+    counters (starting with one of skip_prefixes) are not, those requests
+    were already counted.
+    """
+    parts = name.rsplit('.', 3)
+    return stat_type == 'c' and len(parts) >= 3 and \
+        parts[-2].isupper() and parts[-1].isdigit() and \
+        not name.startswith(skip_prefixes)
+
+
+def receive(sock, stop, report_interval=0, skip_prefixes=()):
+    """
+    Receive and parse statsd packets until stop() returns True.
+
+    :returns: dict of packet, line, byte, invalid line counts and the
+              number of requests the (scaled) request counters add up to
+    """
+    stats = {'packets': 0, 'lines': 0, 'bytes': 0, 'invalid': 0,
+             'requests': 0.0}
+    last_report = time()
+    recv = sock.recv
+    while not stop():
+        # drain everything that's queued before checking for stop again
+        while True:
+            try:
+                data = recv(65535)
+            except socket.timeout:
+                break
+            stats['packets'] += 1
+            stats['bytes'] += len(data)
+            for line in data.split('\n'):
+                if not line:
+                    continue
+                stats['lines'] += 1
+                parsed = parse_line(line)
+                if parsed is None:
+                    stats['invalid'] += 1
+                elif is_request_counter(parsed[0], parsed[2],
+                                        skip_prefixes):
+                    stats['requests'] += parsed[1] / parsed[3]
+        if report_interval and time() - last_report >= report_interval:
+            last_report = time()
+            print "received %(packets)d packets, %(lines)d lines, " \
+                "%(requests)d requests" % stats
+            sys.stdout.flush()
+    return stats
+
+
+def bind(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 << 20)
+    sock.bind((host, port))
+    sock.settimeout(0.1)
+    return sock
+
+
+def receiver_process(sock, conn, skip_prefixes):
+    """Receive until the harness sends on conn, then send back the stats"""
+    conn.send(receive(sock, conn.poll, skip_prefixes=skip_prefixes))
+
+
+def run_load(app, concurrency, requests, seed=0):
+    """
+    Make requests through app from concurrency greenthreads, running the
+    posthooks like eventlet.wsgi does.
+
+    :returns: tuple of (elapsed seconds, sorted list of request latencies)
+    """
+    rand = random.Random(seed)
+    mix = weighted(REQUEST_MIX)
+    latencies = []
+
+    def request(i):
+        path, method = rand.choice(mix)
+        if '%d' in path:
+            path = path % ((rand.randint(0, 99),) * path.count('%d'))
+        env = {'REQUEST_METHOD': method, 'PATH_INFO': path,
+               'SCRIPT_NAME': '', 'QUERY_STRING': '',
+               'SERVER_NAME': 'localhost', 'SERVER_PORT': '80',
+               'wsgi.url_scheme': 'http', 'eventlet.posthooks': []}
+        start = time()
+        body = app(env, lambda status, headers, exc_info=None: None)
+        for chunk in body:
+            pass
+        if hasattr(body, 'close'):
+            body.close()
+        latencies.append(time() - start)
+        for hook, args, kwargs in env['eventlet.posthooks']:
+            hook(env, *args, **kwargs)
+
+    pool = GreenPool(concurrency)
+    start = time()
+    for i in xrange(requests):
+        pool.spawn_n(request, i)
+    pool.waitall()
+    return time() - start, sorted(latencies)
+
+
+def percentile(values, pct):
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-c', '--concurrency', type='int', default=100)
+    parser.add_option('-n', '--requests', type='int', default=20000)
+    parser.add_option('--latency', type='float', default=5,
+                      help='mean fake app latency in ms (default %default)')
+    parser.add_option('--size', type='int', default=16384,
+                      help='mean GET body size (default %default)')
+    parser.add_option('-o', '--option', action='append', default=[],
+                      help='informant option as key=value, repeatable')
+    parser.add_option('--host', default='127.0.0.1')
+    parser.add_option('--port', type='int', default=0,
+                      help='receiver port (default: any free port)')
+    parser.add_option('--receive-only', action='store_true',
+                      help='only run the receiver, reporting every second')
+    options, args = parser.parse_args()
+
+    conf = dict(option.split('=', 1) for option in options.option)
+    skip_prefixes = account_prefixes(conf)
+    sock = bind(options.host, options.port)
+    if options.receive_only:
+        print "Listening on %s:%d" % sock.getsockname()
+        try:
+            receive(sock, lambda: False, report_interval=1,
+                    skip_prefixes=skip_prefixes)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    conf['statsd_host'], conf['statsd_port'] = sock.getsockname()
+    conf['statsd_port'] = str(conf['statsd_port'])
+    parent, child = multiprocessing.Pipe()
+    receiver = multiprocessing.Process(target=receiver_process,
+                                       args=(sock, child, skip_prefixes))
+    receiver.start()
+    sock.close()
+
+    bare_elapsed, bare_latencies = run_load(
+        FakeSwiftApp(options.latency, options.size), options.concurrency,
+        options.requests)
+    app = Informant(FakeSwiftApp(options.latency, options.size), conf)
+    lines_sent = [0]
+    orig_send = app.sender.send
+
+    def counting_send(payloads, combined_events=False):
+        orig_send(payloads, combined_events)
+        lines_sent[0] += len(payloads)
+    app.sender.send = counting_send
+    elapsed, latencies = run_load(app, options.concurrency,
+                                  options.requests)
+    # let a sender greenthread drain and send whatever was aggregated
+    eventlet.sleep(0.1)
+    app.flush_events()
+    eventlet.sleep(0.5)
+    parent.send(None)
+    received = parent.recv()
+    receiver.join()
+
+    print "requests:           %d (%d concurrent)" % (options.requests,
+                                                      options.concurrency)
+    print "throughput:         %d req/s (bare app %d req/s)" % (
+        options.requests / elapsed, options.requests / bare_elapsed)
+    for name, pct in (('mean', None), ('p50', 50), ('p99', 99)):
+        if pct is None:
+            value = sum(latencies) / len(latencies)
+            bare = sum(bare_latencies) / len(bare_latencies)
+        else:
+            value = percentile(latencies, pct)
+            bare = percentile(bare_latencies, pct)
+        print "added latency %-4s  %+.3f ms" % (name, (value - bare) * 1000)
+    print "packets:            %d sent, %d received, %.2f%% lost" % (
+        app.sender.packets_sent, received['packets'],
+        100.0 * (app.sender.packets_sent - received['packets']) /
+        (app.sender.packets_sent or 1))
+    print "lines:              %d sent, %d received, %.2f%% lost, " \
+        "%d invalid" % (lines_sent[0], received['lines'],
+                        100.0 * (lines_sent[0] - received['lines']) /
+                        (lines_sent[0] or 1), received['invalid'])
+    print "dropped by informant: %d queued events, %d lines" % (
+        app.dropped_events, app.dropped_lines)
+    print "requests counted:   %d (%.2f%% off)" % (
+        received['requests'], 100.0 * (received['requests'] -
+                                       options.requests) / options.requests)
+
+
+if __name__ == '__main__':
+    main()
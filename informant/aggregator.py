@@ -0,0 +1,153 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from time import time
+
+from informant.emitters import StatsdEmitter
+from informant.histogram import Histogram
+
+
+class Aggregator(object):
+    """
+    Accumulates statsd counters and timers in memory so that they can be
+    flushed to statsd periodically instead of once per request.
+    """
+
+    def __init__(self, histograms=False, percentiles=(50, 90, 99),
+                 emitter=None):
+        self.emitter = emitter or StatsdEmitter()
+        self.histograms = histograms
+        self.percentiles = sorted(percentiles)
+        self.counters = {}
+        self.timers = {}
+
+    def incr(self, name, value=1):
+        """
+        Add value to the counter name, names are the emitter's series
+        keys.
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def timing(self, name, value):
+        """Record a single timer value (in ms) for name"""
+        if self.histograms:
+            histogram = self.timers.get(name)
+            if histogram is None:
+                histogram = self.timers[name] = Histogram()
+            histogram.record(value)
+            return
+        stats = self.timers.get(name)
+        if stats is None:
+            # count, sum, lower, upper
+            self.timers[name] = [1, value, value, value]
+        else:
+            stats[0] += 1
+            stats[1] += value
+            if value < stats[2]:
+                stats[2] = value
+            elif value > stats[3]:
+                stats[3] = value
+
+    def add(self, stats, sample_rate=1.0):
+        """
+        Accumulate a list of (series, value, type) stats as generated
+        by Informant.statsd_event. Counters are scaled by the rate the
+        stats were sampled at.
+        """
+        for metric, value, stat_type in stats:
+            if stat_type == 'ms':
+                self.timing(metric, value)
+            else:
+                self.incr(metric, value / sample_rate)
+
+    def take(self):
+        """
+        Reset the accumulated stats and return them as plain data (so they
+        can be marshaled and merged with the stats of other workers).
+
+        :returns: dict with the counters and timers
+        """
+        counters, self.counters = self.counters, {}
+        timers, self.timers = self.timers, {}
+        if self.histograms:
+            timers = dict((name, histogram.sparse())
+                          for name, histogram in timers.iteritems())
+        return {'counters': counters, 'timers': timers}
+
+    def merge(self, state, other):
+        """Merge the stats taken from another Aggregator into state"""
+        counters = state['counters']
+        for name, value in other['counters'].iteritems():
+            counters[name] = counters.get(name, 0) + value
+        timers = state['timers']
+        for name, stats in other['timers'].iteritems():
+            mine = timers.get(name)
+            if mine is None:
+                timers[name] = stats
+            elif self.histograms:
+                buckets = mine[2]
+                for index, count in stats[2].iteritems():
+                    buckets[index] = buckets.get(index, 0) + count
+                timers[name] = (mine[0] + stats[0], max(mine[1], stats[1]),
+                                buckets)
+            else:
+                timers[name] = [mine[0] + stats[0], mine[1] + stats[1],
+                                min(mine[2], stats[2]),
+                                max(mine[3], stats[3])]
+        return state
+
+    def format(self, state, timestamp=None):
+        """
+        Format taken stats as lines for the emitter. Counters are already
+        scaled by their sample rates, timers are summarized as
+        count/mean/lower/upper gauges or, when using histograms, as
+        count/max and percentile (e.g. p99) gauges.
+
+        :returns: list of lines
+        """
+        if timestamp is None:
+            timestamp = time()
+        counter = self.emitter.counter
+        gauge = self.emitter.gauge
+        lines = []
+        for name, value in state['counters'].iteritems():
+            lines.append(counter(name, value, timestamp))
+        if self.histograms:
+            for name, sparse in state['timers'].iteritems():
+                histogram = Histogram()
+                histogram.merge_sparse(sparse)
+                lines.append(gauge(name, '.count', histogram.count,
+                                   timestamp))
+                lines.append(gauge(name, '.max', histogram.max, timestamp))
+                for percentile, value in zip(
+                        self.percentiles,
+                        histogram.percentiles(self.percentiles)):
+                    lines.append(gauge(name, '.p%s' % percentile, value,
+                                       timestamp))
+            return lines
+        for name, (count, total, lower, upper) in \
+                state['timers'].iteritems():
+            lines.append(gauge(name, '.count', count, timestamp))
+            lines.append(gauge(name, '.mean', total / count, timestamp))
+            lines.append(gauge(name, '.lower', lower, timestamp))
+            lines.append(gauge(name, '.upper', upper, timestamp))
+        return lines
+
+    def flush(self):
+        """
+        Reset the accumulated stats and return them as lines for the
+        emitter.
+
+        :returns: list of lines
+        """
+        return self.format(self.take())
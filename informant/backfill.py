@@ -0,0 +1,357 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import sys
+from calendar import timegm
+from collections import deque
+from multiprocessing import Pool
+from optparse import OptionParser
+from time import strptime
+from urllib import unquote
+
+from informant.aggregator import Aggregator
+from informant.emitters import GraphiteEmitter
+from informant.metrics import EventRecord, DEFAULT_METHODS, classify, \
+    metric_specs
+from informant.sender import GraphiteSender
+
+#: proxy-logging access log fields, relative to the client ip
+DATETIME, METHOD, PATH, PROTOCOL, STATUS = 2, 3, 4, 5, 6
+BYTES_RECVD, BYTES_SENT, REQUEST_TIME, SOURCE, START_TIME = 10, 11, 15, 16, 18
+
+#: the options used by parse_lines in the worker processes
+_options = None
+
+
+def _int(value):
+    return 0 if value == '-' else int(value)
+
+
+def parse_line(line, valid_methods=DEFAULT_METHODS, _dates={}):
+    """
+    Parse a proxy-server access log line, with or without a syslog
+    prefix, into an EventRecord. The access log has no start response
+    time so that field is None.
+
+    :returns: tuple of (start time, EventRecord), None if the line isn't
+              an access log line
+    """
+    fields = line.split()
+    # the log line starts 5 fields before the protocol, whatever the prefix
+    for base in xrange(len(fields) - SOURCE):
+        if fields[base + PROTOCOL].startswith('HTTP/'):
+            break
+    else:
+        return None
+    try:
+        status = int(fields[base + STATUS])
+        duration = float(fields[base + REQUEST_TIME])
+        if len(fields) > base + START_TIME and \
+                fields[base + START_TIME] != '-':
+            start_time = float(fields[base + START_TIME])
+        else:
+            end_time = _dates.get(fields[base + DATETIME])
+            if end_time is None:
+                if len(_dates) > 1024:
+                    _dates.clear()
+                end_time = _dates[fields[base + DATETIME]] = timegm(
+                    strptime(fields[base + DATETIME], '%d/%b/%Y/%H/%M/%S'))
+            start_time = end_time - duration
+        transferred = _int(fields[base + BYTES_RECVD]) or \
+            _int(fields[base + BYTES_SENT])
+    except ValueError:
+        return None
+    source = fields[base + SOURCE]
+    stat_type, method, acct = classify(
+        fields[base + METHOD], unquote(fields[base + PATH].split('?', 1)[0]),
+        None if source == '-' else source, valid_methods)
+    return start_time, EventRecord(stat_type, method, status,
+                                   duration * 1000, None, transferred, acct,
+                                   rate=1.0)
+
+
+def _init_worker(options):
+    global _options
+    _options = options
+
+
+def parse_lines(lines, options=None):
+    """
+    Parse and aggregate access log lines per time bucket.
+
+    :param options: dict of bucket, valid_methods, prepend,
+                    prefix_accounts, prefix_accounts_prepend, histograms
+                    and percentiles, defaults to the worker's options
+    :returns: tuple of ({bucket: (requests, aggregated state)}, number of
+              unparsable lines, latest start time seen)
+    """
+    options = options or _options
+    bucket_size = options['bucket']
+    valid_methods = options['valid_methods']
+    aggregators = {}
+    specs = {}
+    invalid = 0
+    latest = 0
+    for line in lines:
+        parsed = parse_line(line, valid_methods)
+        if parsed is None:
+            invalid += 1
+            continue
+        start_time, record = parsed
+        if start_time > latest:
+            latest = start_time
+        bucket = int(start_time // bucket_size * bucket_size)
+        aggregator = aggregators.get(bucket)
+        if aggregator is None:
+            aggregator = aggregators[bucket] = [0, Aggregator(
+                options['histograms'], options['percentiles'])]
+        aggregator[0] += 1
+        key = record[:3] + (record.acct,)
+        record_specs = specs.get(key)
+        if record_specs is None:
+            record_specs = specs[key] = [
+                (metric.name, stat_type, field)
+                for metric, stat_type, field in metric_specs(
+                    record, options['prepend'], options['prefix_accounts'],
+                    options['prefix_accounts_prepend'])]
+        for name, stat_type, field in record_specs:
+            if field is None:
+                aggregator[1].incr(name)
+            else:
+                value = getattr(record, field)
+                if value is None:
+                    continue
+                if stat_type == 'ms':
+                    aggregator[1].timing(name, value)
+                else:
+                    aggregator[1].incr(name, value)
+    return (dict((bucket, (requests, aggregator.take()))
+                 for bucket, (requests, aggregator) in
+                 aggregators.iteritems()), invalid, latest)
+
+
+def open_log(path):
+    """Open a (possibly gzip compressed) log file, - is stdin"""
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def first_timestamp(path, valid_methods=DEFAULT_METHODS, max_lines=1000):
+    """
+    :returns: the start time of the first access log line in the first
+              max_lines lines of a log file, None if there isn't one
+    """
+    log = open_log(path)
+    try:
+        for i, line in enumerate(log):
+            if i >= max_lines:
+                break
+            parsed = parse_line(line, valid_methods)
+            if parsed is not None:
+                return parsed[0]
+    finally:
+        log.close()
+    return None
+
+
+def sort_paths(paths, valid_methods=DEFAULT_METHODS):
+    """
+    Order log files oldest first by their first line, so rotated logs can
+    be given in any order (e.g. by a glob). Stdin and files without an
+    access log line near the start go last, in the order given.
+    """
+    keyed = []
+    for index, path in enumerate(paths):
+        timestamp = None
+        if path != '-':
+            timestamp = first_timestamp(path, valid_methods)
+        if timestamp is None:
+            keyed.append(((1, index), path))
+        else:
+            keyed.append(((0, timestamp), path))
+    return [path for _junk, path in sorted(keyed)]
+
+
+def read_chunks(paths, chunk_size):
+    """
+    Stream the lines of log files in chunks
+
+    :returns: generator of lists of at most chunk_size lines
+    """
+    for path in paths:
+        log = open_log(path)
+        try:
+            chunk = []
+            for line in log:
+                chunk.append(line)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+        finally:
+            if log is not sys.stdin:
+                log.close()
+
+
+class Backfill(object):
+    """
+    Merges the per bucket stats parsed from the logs and writes out the
+    buckets that are complete. A bucket is complete once a line starting
+    lag seconds after it has been seen, stats for a bucket that was
+    already written are dropped and counted as late.
+    """
+
+    def __init__(self, options, write):
+        self.options = options
+        self.write = write
+        self.aggregator = Aggregator(options['histograms'],
+                                     options['percentiles'],
+                                     GraphiteEmitter())
+        self.pending = {}
+        self.written_through = None
+        self.requests = 0
+        self.invalid = 0
+        self.late = 0
+
+    def add(self, result):
+        """Merge the result of parse_lines and write complete buckets"""
+        buckets, invalid, latest = result
+        self.invalid += invalid
+        for bucket, (requests, state) in buckets.iteritems():
+            if self.written_through is not None and \
+                    bucket <= self.written_through:
+                self.late += requests
+                continue
+            self.requests += requests
+            if bucket in self.pending:
+                self.aggregator.merge(self.pending[bucket][1], state)
+                self.pending[bucket][0] += requests
+            else:
+                self.pending[bucket] = [requests, state]
+        self.flush(latest - self.options['bucket'] - self.options['lag'])
+
+    def flush(self, through=None):
+        """Write the buckets that start at or before through, or all"""
+        for bucket in sorted(self.pending):
+            if through is not None and bucket > through:
+                break
+            self.write(self.aggregator.format(self.pending.pop(bucket)[1],
+                                              bucket))
+            self.written_through = bucket
+
+
+def run(paths, options, write, workers=1, chunk_size=10000):
+    """
+    Backfill metrics from access logs, parsing chunks of lines in a pool
+    of worker processes. At most two chunks per worker are in flight so
+    memory use doesn't depend on the size of the logs. The logs are read
+    oldest first whatever order they're given in, buckets that were
+    already written would otherwise drop everything in older logs as
+    late.
+
+    :param write: called with a list of graphite plaintext lines
+    :returns: the Backfill with the request, invalid and late line counts
+    """
+    backfill = Backfill(options, write)
+    chunks = read_chunks(sort_paths(paths, options['valid_methods']),
+                         chunk_size)
+    if workers <= 1:
+        for chunk in chunks:
+            backfill.add(parse_lines(chunk, options))
+    else:
+        pool = Pool(workers, _init_worker, (options,))
+        try:
+            in_flight = deque()
+            for chunk in chunks:
+                in_flight.append(pool.apply_async(parse_lines, (chunk,)))
+                if len(in_flight) >= workers * 2:
+                    backfill.add(in_flight.popleft().get())
+            while in_flight:
+                backfill.add(in_flight.popleft().get())
+        finally:
+            pool.terminate()
+    backfill.flush()
+    return backfill
+
+
+def main(args=None):
+    parser = OptionParser(usage='%prog [options] LOG [LOG ...]\n\n'
+                          'Generate informant metrics from proxy-server '
+                          'access logs (- for stdin, .gz files are\n'
+                          'decompressed) and write them as graphite '
+                          'plaintext with the original timestamps.')
+    parser.add_option('-o', '--output', default='-',
+                      help='file to write to (default stdout)')
+    parser.add_option('-g', '--graphite',
+                      help='send to graphite at host[:port] instead')
+    parser.add_option('-b', '--bucket', type='int', default=10,
+                      help='seconds per time bucket (default %default)')
+    parser.add_option('-l', '--lag', type='int', default=300,
+                      help='seconds log lines may be out of order '
+                      '(default %default)')
+    parser.add_option('-w', '--workers', type='int', default=4)
+    parser.add_option('--metric-name-prepend', default='')
+    parser.add_option('--prefix-accounts', default='')
+    parser.add_option('--prefix-accounts-metric-prepend', default='')
+    parser.add_option('--valid-http-methods',
+                      default=','.join(DEFAULT_METHODS))
+    parser.add_option('--timer-histograms', action='store_true')
+    parser.add_option('--timer-percentiles', default='50,90,99')
+    options, paths = parser.parse_args(args)
+    if not paths:
+        parser.error('no log files given')
+    parse_options = {
+        'bucket': options.bucket,
+        'lag': options.lag,
+        'valid_methods': [s.strip().upper() for s in
+                          options.valid_http_methods.split(',')
+                          if s.strip()],
+        'prepend': options.metric_name_prepend,
+        'prefix_accounts': set(s.strip() for s in
+                               options.prefix_accounts.split(',')
+                               if s.strip()),
+        'prefix_accounts_prepend': options.prefix_accounts_metric_prepend,
+        'histograms': options.timer_histograms,
+        'percentiles': [int(s) for s in
+                        options.timer_percentiles.split(',') if s.strip()]}
+    if options.graphite:
+        host, _junk, port = options.graphite.partition(':')
+        sender = GraphiteSender(host, int(port or 2003))
+        write = sender.send
+    elif options.output == '-':
+        sender = None
+
+        def write(lines):
+            sys.stdout.writelines(line + '\n' for line in lines)
+    else:
+        sender = open(options.output, 'w')
+
+        def write(lines):
+            sender.writelines(line + '\n' for line in lines)
+    try:
+        backfill = run(paths, parse_options, write, options.workers)
+    finally:
+        if sender is not None:
+            sender.close()
+    print >>sys.stderr, '%d requests, %d unparsable lines, %d late ' \
+        'requests dropped' % (backfill.requests, backfill.invalid,
+                              backfill.late)
+
+
+if __name__ == '__main__':
+    main()
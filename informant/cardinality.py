@@ -0,0 +1,89 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+#: what values over a dimension's limit are folded into
+OTHER = 'other'
+
+#: the dimensions whose values come from requests rather than config
+DIMENSIONS = ('type', 'status', 'source')
+
+
+class CardinalityGuard(object):
+    """
+    Caps the number of distinct values of each dimension per interval,
+    values first seen after a dimension's limit was reached are folded
+    into OTHER until the next interval.
+
+    :param limits: dict of dimension to the maximum number of distinct
+                   values, dimensions without a limit aren't capped
+    """
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.seen = dict((dimension, set()) for dimension in limits)
+        self.folded = dict.fromkeys(limits, 0)
+
+    def fold(self, dimension, value):
+        """:returns: value, or OTHER if it's over the dimension's limit"""
+        seen = self.seen.get(dimension)
+        if seen is None or value in seen:
+            return value
+        if len(seen) < self.limits[dimension]:
+            seen.add(value)
+            return value
+        self.folded[dimension] += 1
+        return OTHER
+
+    def fold_record(self, record):
+        """
+        Fold an EventRecord's stat_type (which is the swift.source of
+        subrequests), status and subrequest sources.
+
+        :returns: the EventRecord, or a copy with the folded values
+        """
+        fold = self.fold
+        stat_type = fold('type', record.stat_type)
+        status = fold('status', record.status)
+        subrequests = record.subrequests
+        if subrequests:
+            folded = []
+            other = None
+            for summary in subrequests:
+                if fold('source', summary[0]) is not OTHER:
+                    folded.append(summary)
+                elif other is None:
+                    other = (OTHER,) + tuple(summary[1:])
+                else:
+                    other = (OTHER,) + tuple(
+                        a + b for a, b in zip(other[1:], summary[1:]))
+            if other is not None:
+                folded.append(other)
+                subrequests = tuple(folded)
+        if stat_type is record.stat_type and status is record.status and \
+                subrequests is record.subrequests:
+            return record
+        return record._replace(stat_type=stat_type, status=status,
+                               subrequests=subrequests)
+
+    def take(self):
+        """
+        Start a new interval
+
+        :returns: dict of dimension to the number of values folded during
+                  this interval
+        """
+        folded = self.folded
+        self.seen = dict((dimension, set()) for dimension in self.limits)
+        self.folded = dict.fromkeys(self.limits, 0)
+        return folded
@@ -0,0 +1,110 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import namedtuple
+
+#: A metric generated for a request: its full dotted statsd name, the name
+#: of the measurement (e.g. srt) and the (key, value) tags it was
+#: generated for (e.g. ('type', 'obj'))
+Metric = namedtuple('Metric', ['name', 'kind', 'tags'])
+
+
+class StatsdEmitter(object):
+    """
+    Formats metrics as plain statsd lines, every dimension is encoded in
+    the dotted metric name.
+    """
+
+    #: whether the emitter can only be used with aggregate_events
+    aggregate_only = False
+
+    def series(self, metric):
+        """:returns: the key metric is aggregated under"""
+        return metric.name
+
+    def plain_series(self, name):
+        """:returns: the key for a metric without any tags"""
+        return name
+
+    def template(self, series, stat_type, rate):
+        """
+        :returns: the line template for a single sampled value of series,
+                  the value is filled in with %d
+        """
+        return "%s:%%d|%s|@%s" % (series.replace('%', '%%'), stat_type,
+                                  rate)
+
+    def counter(self, series, value, timestamp):
+        return "%s:%d|c" % (series, value)
+
+    def gauge(self, series, suffix, value, timestamp):
+        return "%s%s:%d|g" % (series, suffix, value)
+
+
+class DogStatsdEmitter(StatsdEmitter):
+    """
+    Formats metrics as DogStatsD lines, the stat type, method, status and
+    account are sent as tags (e.g. #type:obj,method:GET,status:200) of a
+    metric named after the measurement, instead of in the metric name.
+    """
+
+    def series(self, metric):
+        return (metric.kind, ','.join(
+            '%s:%s' % (key, str(value).replace(',', '_').replace('|', '_'))
+            for key, value in metric.tags))
+
+    def plain_series(self, name):
+        return (name, '')
+
+    def _tags(self, tags):
+        if tags:
+            return '|#' + tags
+        return ''
+
+    def template(self, series, stat_type, rate):
+        name, tags = series
+        return "%s:%%d|%s|@%s%s" % (name.replace('%', '%%'), stat_type, rate,
+                                    self._tags(tags).replace('%', '%%'))
+
+    def counter(self, series, value, timestamp):
+        name, tags = series
+        return "%s:%d|c%s" % (name, value, self._tags(tags))
+
+    def gauge(self, series, suffix, value, timestamp):
+        name, tags = series
+        return "%s%s:%d|g%s" % (name, suffix, value, self._tags(tags))
+
+
+class GraphiteEmitter(StatsdEmitter):
+    """
+    Formats aggregated metrics as graphite plaintext lines with the dotted
+    statsd names.
+    """
+
+    aggregate_only = True
+
+    def template(self, series, stat_type, rate):
+        return None
+
+    def counter(self, series, value, timestamp):
+        return "%s %d %d" % (series, value, timestamp)
+
+    def gauge(self, series, suffix, value, timestamp):
+        return "%s%s %d %d" % (series, suffix, value, timestamp)
+
+
+EMITTERS = {
+    'statsd': StatsdEmitter,
+    'dogstatsd': DogStatsdEmitter,
+    'graphite': GraphiteEmitter,
+}
@@ -0,0 +1,131 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+from time import time
+
+from informant.wrappers import SubrequestTimer
+
+#: contexts of the client requests in progress in this worker by
+#: transaction id, subrequests made by middleware only carry the
+#: swift.trans_id of their client request over to their environ
+CONTEXTS = OrderedDict()
+#: bound on CONTEXTS in case a client request's posthook never runs
+MAX_CONTEXTS = 10000
+
+
+class FanOut(object):
+    """
+    The subrequests made on behalf of a client request, per swift.source
+    """
+
+    __slots__ = ('trans_id', 'sources')
+
+    def __init__(self):
+        self.trans_id = None
+        # source -> [count, total ms, bytes]
+        self.sources = {}
+
+    def add(self, source, duration, nbytes):
+        """Record a finished subrequest"""
+        stats = self.sources.get(source)
+        if stats is None:
+            self.sources[source] = [1, duration, nbytes]
+        else:
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] += nbytes
+
+    def summary(self):
+        """:returns: tuple of (source, count, total ms, bytes) tuples"""
+        return tuple((source, count, duration, nbytes) for
+                     source, (count, duration, nbytes) in
+                     sorted(self.sources.iteritems()))
+
+
+def register(context, trans_id):
+    """Make a client request's context findable by its transaction id"""
+    if context.trans_id is None:
+        context.trans_id = trans_id
+        if len(CONTEXTS) >= MAX_CONTEXTS:
+            CONTEXTS.popitem(last=False)
+        CONTEXTS[trans_id] = context
+
+
+def lookup(trans_id):
+    """:returns: the FanOut registered for trans_id, or None"""
+    return CONTEXTS.get(trans_id)
+
+
+def unregister(context):
+    """Forget a finished client request's context"""
+    if context.trans_id is not None:
+        CONTEXTS.pop(context.trans_id, None)
+
+
+class FanOutRegistrar(object):
+    """
+    Makes a client request's context findable by its transaction id as
+    soon as it has one, so subrequests made before the client request is
+    passed on (or when it never is, e.g. bulk deletes) are attributed to
+    it. Goes right after catch_errors.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, env, start_response):
+        context = env.get('informant.fanout')
+        if context is not None:
+            trans_id = env.get('swift.trans_id')
+            if trans_id is not None:
+                register(context, trans_id)
+        return self.app(env, start_response)
+
+
+class FanOutCollector(object):
+    """
+    Passes requests through, timing those that are subrequests of a
+    client request whose context was created by an informant with
+    subrequest_fanout earlier in the pipeline. Goes right before
+    proxy-server.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, env, start_response):
+        trans_id = env.get('swift.trans_id')
+        if trans_id is None:
+            return self.app(env, start_response)
+        context = env.get('informant.fanout')
+        if context is not None:
+            # the client request itself (in case there's no registrar),
+            # its subrequests will only carry its transaction id
+            register(context, trans_id)
+            return self.app(env, start_response)
+        context = lookup(trans_id)
+        if context is None:
+            return self.app(env, start_response)
+        start_time = time()
+        return SubrequestTimer(self.app(env, start_response), context,
+                               env.get('swift.source') or 'unknown',
+                               start_time)
+
+
+def registrar_filter_factory(global_conf, **local_conf):
+    return FanOutRegistrar
+
+
+def collector_filter_factory(global_conf, **local_conf):
+    return FanOutCollector
@@ -0,0 +1,111 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from array import array
+
+#: log2 of the number of linear sub buckets per power of two, 5 bits keeps
+#: the relative error of a recorded value under ~3%
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+#: values are clamped to 2 ** MAX_VALUE_BITS - 1 (~49 days in ms)
+MAX_VALUE_BITS = 32
+MAX_VALUE = (1 << MAX_VALUE_BITS) - 1
+BUCKETS = SUB_BUCKETS + (MAX_VALUE_BITS - SUB_BUCKET_BITS) * SUB_BUCKETS
+
+
+def bucket_index(value):
+    """Map a non negative integer value to its histogram bucket"""
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return SUB_BUCKETS * (shift + 1) + (value >> shift) - SUB_BUCKETS
+
+
+def bucket_upper(index):
+    """The largest value that maps to the bucket index"""
+    if index < SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    sub = index % SUB_BUCKETS + SUB_BUCKETS
+    return ((sub + 1) << shift) - 1
+
+
+class Histogram(object):
+    """
+    Fixed size log-linear (HDR style) histogram of integer values. Memory
+    use is fixed no matter how many values are recorded.
+    """
+
+    def __init__(self):
+        self.counts = array('l', [0]) * BUCKETS
+        self.count = 0
+        self.max = 0
+
+    def record(self, value):
+        """Record a single value"""
+        value = int(value)
+        if value < 0:
+            value = 0
+        elif value > MAX_VALUE:
+            value = MAX_VALUE
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def sparse(self):
+        """
+        :returns: (count, max, {bucket index: count}) for the non empty
+                  buckets, a compact plain data copy of the histogram
+        """
+        return (self.count, self.max,
+                dict((index, count) for index, count in
+                     enumerate(self.counts) if count))
+
+    def merge_sparse(self, sparse):
+        """Add the values of a histogram's sparse() copy to this one"""
+        count, max_value, buckets = sparse
+        for index, bucket_count in buckets.iteritems():
+            self.counts[index] += bucket_count
+        self.count += count
+        if max_value > self.max:
+            self.max = max_value
+
+    def percentiles(self, percentiles):
+        """
+        Calculate percentiles of the recorded values. Each percentile is
+        reported as the upper bound of the bucket it falls in (but never
+        more than the max recorded value).
+
+        :param percentiles: sorted list of percentiles (0 - 100)
+        :returns: list of values, one per requested percentile
+        """
+        results = []
+        if not self.count:
+            return [0] * len(percentiles)
+        wanted = iter(percentiles)
+        percentile = next(wanted, None)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if not count:
+                continue
+            seen += count
+            while percentile is not None and \
+                    seen * 100.0 >= percentile * self.count:
+                results.append(min(bucket_upper(index), self.max))
+                percentile = next(wanted, None)
+            if percentile is None:
+                break
+        while len(results) < len(percentiles):
+            results.append(self.max)
+        return results
@@ -0,0 +1,83 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+class InFlight(object):
+    """
+    Counts the requests in progress per (stat_type, method) and the peak
+    since the counts were last taken.
+    """
+
+    def __init__(self):
+        self.current = {}
+        self.peaks = {}
+        self.total = 0
+        self.total_peak = 0
+
+    def start(self, key):
+        count = self.current.get(key, 0) + 1
+        self.current[key] = count
+        if count > self.peaks.get(key, 0):
+            self.peaks[key] = count
+        self.total += 1
+        if self.total > self.total_peak:
+            self.total_peak = self.total
+
+    def finish(self, key):
+        self.current[key] -= 1
+        self.total -= 1
+
+    def take(self):
+        """
+        Start a new interval, classes that are idle and were idle for the
+        whole interval are forgotten.
+
+        :returns: list of (key, current, peak) for this interval's classes
+        """
+        counts = [(key, self.current.get(key, 0), peak)
+                  for key, peak in self.peaks.iteritems()]
+        self.current = dict((key, count) for key, count in
+                            self.current.iteritems() if count)
+        self.peaks = dict(self.current)
+        self.total_peak = self.total
+        return counts
+
+
+class InFlightRequest(object):
+    """
+    Passes a response app_iter through and finishes the request in its
+    InFlight once it's closed, or when finish is called (e.g. from a
+    posthook) if the server never closed it. It's only counted once.
+    """
+
+    def __init__(self, inflight, key):
+        self.inflight = inflight
+        self.key = key
+        self.app_iter = ()
+        inflight.start(key)
+
+    def __iter__(self):
+        return iter(self.app_iter)
+
+    def finish(self, *args):
+        if self.inflight is not None:
+            self.inflight.finish(self.key)
+            self.inflight = None
+
+    def close(self):
+        try:
+            close = getattr(self.app_iter, 'close', None)
+            if close:
+                close()
+        finally:
+            self.finish()
@@ -0,0 +1,234 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+from bisect import bisect_right
+from collections import namedtuple
+
+from informant.emitters import Metric
+
+#: Compact summary of a single request, as queued for the sender greenthread
+EventRecord = namedtuple('EventRecord', [
+    'stat_type', 'method', 'status', 'duration', 'start_response_time',
+    'transferred', 'acct', 'ttfb', 'ttlb', 'send_rate', 'upload_rate',
+    'upload_stall', 'rate', 'subrequests', 'size_bucket', 'ms_per_mb'])
+#: fields only populated when the matching options are enabled
+EventRecord.__new__.__defaults__ = (None,) * 9
+
+#: stat_type by the number of path segments following the version
+PATH_STAT_TYPES = ('acct', 'cont', 'obj')
+
+DEFAULT_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'COPY', 'OPTIONS')
+
+#: characters that can't safely be part of a metric name segment in any
+#: of the emitters' formats (e.g. . : | # @ , and whitespace)
+UNSAFE_NAME_CHARS = re.compile(r'[^\w\-]')
+
+DEFAULT_SIZE_BUCKETS = '4K,64K,1M,16M,256M'
+
+#: size suffixes, powers of 1024
+SIZE_UNITS = (('G', 1 << 30), ('M', 1 << 20), ('K', 1 << 10))
+
+
+def parse_size(value):
+    """Parse a byte count with an optional K, M or G suffix"""
+    value = value.strip().upper()
+    for suffix, multiplier in SIZE_UNITS:
+        if value.endswith(suffix):
+            return int(value[:-1]) * multiplier
+    return int(value)
+
+
+def format_size(size):
+    """Format a byte count with the largest suffix it's a multiple of"""
+    for suffix, multiplier in SIZE_UNITS:
+        if size and size % multiplier == 0:
+            return '%d%s' % (size // multiplier, suffix)
+    return str(size)
+
+
+class SizeBuckets(object):
+    """
+    Maps object sizes to the labels of a fixed set of buckets, e.g. lt4K,
+    lt64K and ge64K for boundaries of 4K and 64K.
+    """
+
+    def __init__(self, boundaries=DEFAULT_SIZE_BUCKETS):
+        self.boundaries = sorted(set(parse_size(b)
+                                     for b in boundaries.split(',')
+                                     if b.strip()))
+        if not self.boundaries:
+            raise ValueError('no size bucket boundaries')
+        self.labels = tuple(['lt' + format_size(b)
+                             for b in self.boundaries] +
+                            ['ge' + format_size(self.boundaries[-1])])
+
+    def label(self, size):
+        """:returns: the label of the bucket size falls in"""
+        return self.labels[bisect_right(self.boundaries, size)]
+
+
+def metric_safe(value):
+    """
+    Make a value taken from a request (e.g. an account) safe to use as a
+    metric name segment by replacing everything but letters, digits, _
+    and - with _.
+    """
+    return UNSAFE_NAME_CHARS.sub('_', value)
+
+
+def classify_path(path):
+    """
+    Classify a request path in a single pass.
+
+    :param path: the request's PATH_INFO
+    :returns: tuple of (stat_type, account), account is None for
+              anything but account, container and object requests
+    """
+    if path.startswith('/v1/'):
+        path = path[4:].rstrip('/')
+    elif path.startswith('/v1.0/'):
+        path = path[6:].rstrip('/')
+    elif path == '/healthcheck':
+        return 'healthcheck', None
+    else:
+        return 'invalid', None
+    if not path:
+        return 'invalid', None
+    acct, sep, rest = path.partition('/')
+    if not sep:
+        return 'acct', acct
+    return PATH_STAT_TYPES[min(rest.count('/') + 1, 2)], acct or None
+
+
+def classify(method, path, source=None, valid_methods=DEFAULT_METHODS):
+    """
+    Classify a request
+
+    :param method: the request method
+    :param path: the request's PATH_INFO
+    :param source: the request's swift.source, if any
+    :param valid_methods: methods not in here are reported as BAD_METHOD
+    :returns: tuple of (stat_type, method, account)
+    """
+    method = method.upper()
+    if method not in valid_methods:
+        method = "BAD_METHOD"
+    stat_type, acct = classify_path(path)
+    if source:
+        stat_type = source
+        if source not in PATH_STAT_TYPES:
+            acct = None
+    return stat_type, method, acct
+
+
+def metric_specs(record, prepend='', prefix_accounts=(),
+                 prefix_accounts_prepend='', response_timing=False,
+                 upload_timing=False):
+    """
+    The metrics generated for an EventRecord's stat_type, method, status,
+    size bucket and (if in prefix_accounts) account.
+
+    :returns: list of (Metric, type, record field) tuples, a field of None
+              means the value is always 1
+    """
+    name = "%s.%s.%s" % (record.stat_type, record.method, record.status)
+    tags = (('type', record.stat_type), ('method', record.method),
+            ('status', record.status))
+    metrics = [
+        (Metric(prepend + name, prepend + 'requests', tags), 'c', None),
+        (Metric(prepend + name, prepend + 'duration', tags), 'ms',
+         'duration'),
+        (Metric("%ssrt.%s" % (prepend, name), prepend + 'srt', tags),
+         'ms', 'start_response_time'),
+        (Metric("%stfer.%s" % (prepend, name), prepend + 'tfer', tags),
+         'c', 'transferred')]
+    if response_timing:
+        for kind, field in (('ttfb', 'ttfb'), ('ttlb', 'ttlb'),
+                            ('bps', 'send_rate')):
+            metrics.append((Metric("%s%s.%s" % (prepend, kind, name),
+                                   prepend + kind, tags), 'ms', field))
+    if upload_timing:
+        for kind, field in (('upload_bps', 'upload_rate'),
+                            ('upload_stall', 'upload_stall')):
+            metrics.append((Metric("%s%s.%s" % (prepend, kind, name),
+                                   prepend + kind, tags), 'ms', field))
+    if record.size_bucket is not None:
+        size_name = "%s.%s" % (name, record.size_bucket)
+        size_tags = tags + (('size', record.size_bucket),)
+        metrics.append((Metric("%ssize.%s" % (prepend, size_name),
+                               prepend + 'size.duration', size_tags),
+                        'ms', 'duration'))
+        metrics.append((Metric("%sms_per_mb.%s" % (prepend, size_name),
+                               prepend + 'ms_per_mb', size_tags),
+                        'ms', 'ms_per_mb'))
+    acct = record.acct
+    if acct is not None and acct in prefix_accounts:
+        prepend = prefix_accounts_prepend
+        acct_tags = tags + (('account', acct),)
+        metrics.append((Metric("%s%s.%s" % (prepend, acct, name),
+                               prepend + 'requests', acct_tags), 'c', None))
+        metrics.append((Metric(
+            "%s%s.%s" % (prepend, acct, record.stat_type),
+            prepend + 'duration',
+            (('type', record.stat_type), ('account', acct))),
+            'ms', 'duration'))
+        metrics.append((Metric("%s%s.srt.%s" % (prepend, acct, name),
+                               prepend + 'srt', acct_tags),
+                        'ms', 'start_response_time'))
+    return metrics
+
+
+def fanout_specs(record, prepend=''):
+    """
+    The metrics for the subrequests made on behalf of an EventRecord's
+    request, per swift.source: the number of subrequests and their total
+    time as timers (so their distribution over client requests is kept)
+    and the bytes they transferred as a counter.
+
+    :returns: list of (Metric, type, value) tuples
+    """
+    metrics = []
+    for source, count, duration, nbytes in record.subrequests or ():
+        name = "%ssubreqs.%s.%s.%s" % (prepend, record.stat_type,
+                                       record.method, source)
+        tags = (('type', record.stat_type), ('method', record.method),
+                ('source', source))
+        metrics.append((Metric(name + '.count', prepend + 'subreqs.count',
+                               tags), 'ms', count))
+        metrics.append((Metric(name + '.time', prepend + 'subreqs.time',
+                               tags), 'ms', duration))
+        metrics.append((Metric(name + '.bytes', prepend + 'subreqs.bytes',
+                               tags), 'c', nbytes))
+    return metrics
+
+
+def record_stats(record, specs):
+    """
+    Generate the stats for an EventRecord from its metric specs (or
+    cached templates), skipping fields that weren't measured.
+
+    :param specs: sequence of tuples starting with the series and type and
+                  ending with the record field
+    :returns: list of (series, value, type) tuples
+    """
+    stats = []
+    for spec in specs:
+        field = spec[-1]
+        if field is None:
+            stats.append((spec[0], 1, spec[1]))
+        else:
+            value = getattr(record, field)
+            if value is not None:
+                stats.append((spec[0], value, spec[1]))
+    return stats
@@ -12,10 +12,37 @@
 # limitations under the License.
 
 from swift.common.swob import Request
-from swift.common.utils import get_logger, TRUE_VALUES, split_path
-from eventlet.green import socket
-from sys import maxint
+from swift.common.utils import get_logger, TRUE_VALUES
+from informant.aggregator import Aggregator
+from informant.shared import SharedAggregator
+from informant.sender import StatsdSender, GraphiteSender, Backoff
+from informant.emitters import EMITTERS, Metric
+from informant.metrics import EventRecord, classify, metric_specs, \
+    fanout_specs, record_stats, metric_safe, SizeBuckets, DEFAULT_SIZE_BUCKETS
+from informant.wrappers import ResponseTimer, InputTimer
+from informant import fanout
+from informant.cardinality import CardinalityGuard, DIMENSIONS
+from informant.inflight import InFlight, InFlightRequest
+from informant.watchdog import HubWatchdog, hub_waiting
+from informant.sketches import SpaceSaving, HyperLogLog
+from informant.tracer import SlowRequestTracer, SlowRequest
+from informant.prometheus import PrometheusRegistry, SharedRegistry, \
+    DEFAULT_BUCKETS, CONTENT_TYPE
+from eventlet import spawn_n, sleep
+from eventlet.queue import LightQueue, Empty, Full
+from collections import OrderedDict
 from time import time
+try:
+    from time import monotonic
+except ImportError:
+    # python 2 has no monotonic clock in the stdlib
+    monotonic = time
+
+
+#: status classes a class_sample_rates entry may match on
+STATUS_CLASSES = ('1xx', '2xx', '3xx', '4xx', '5xx')
+#: bounds for the adaptive sample rate scale (a power of 2)
+MIN_ADAPTIVE_SCALE = 1.0 / (1 << 20)
 
 
 class Informant(object):
@@ -27,161 +54,973 @@ class Informant(object):
         self.logger = get_logger(conf, log_route='informant')
         self.statsd_host = conf.get('statsd_host', '127.0.0.1')
         self.statsd_port = int(conf.get('statsd_port', '8125'))
-        self.statsd_addr = (self.statsd_host, self.statsd_port)
         self.statsd_sample_rate = float(conf.get('statsd_sample_rate', '.5'))
         self.valid_methods = conf.get('valid_http_methods',
                                       'GET,HEAD,POST,PUT,DELETE,COPY,OPTIONS')
         self.valid_methods = [s.strip().upper() for s in
                               self.valid_methods.split(',') if s.strip()]
         self.prefix_accounts = conf.get('prefix_accounts', '')
-        self.prefix_accounts = [s.strip() for s in
-                                self.prefix_accounts.split(',')]
+        self.prefix_accounts = set(s.strip() for s in
+                                   self.prefix_accounts.split(',')
+                                   if s.strip())
         self.combined_events = conf.get('combined_events',
                                         'no').lower() in TRUE_VALUES
         self.combine_key = conf.get('combine_key', '\n')
         if self.combine_key == "\\n":
             self.combine_key = '\n'
+        self.max_packet_size = int(conf.get('max_packet_size', '1432'))
+        emitter = conf.get('emitter', 'statsd').strip().lower()
+        if emitter not in EMITTERS:
+            raise ValueError('Unknown emitter %r, expected one of %s' % (
+                emitter, ', '.join(sorted(EMITTERS))))
+        self.emitter = EMITTERS[emitter]()
+        if emitter == 'graphite':
+            self.sender = GraphiteSender(
+                conf.get('graphite_host', '127.0.0.1'),
+                int(conf.get('graphite_port', '2003')),
+                int(conf.get('graphite_batch_size', '65536')),
+                int(conf.get('graphite_pool_size', '2')))
+        else:
+            self.sender = StatsdSender(self.statsd_host, self.statsd_port,
+                                       self.max_packet_size, self.combine_key)
+        self.backoff = Backoff(
+            int(conf.get('send_failure_threshold', '3')),
+            float(conf.get('send_backoff_initial', '1')),
+            float(conf.get('send_backoff_max', '60')))
+        self.error_log_interval = float(conf.get('error_log_interval', '60'))
+        self._last_error_log = {}
+        self._suppressed_errors = {}
         self.metric_name_prepend = conf.get('metric_name_prepend', '')
         self.prefix_accounts_metric_prepend = conf.get('prefix_accounts_metric_prepend', '')
-        self.actual_rate = 0.0
+        self.aggregate_events = self.emitter.aggregate_only or conf.get(
+            'aggregate_events', 'no').lower() in TRUE_VALUES
+        self.flush_interval = float(conf.get('flush_interval', '10'))
+        self.timer_histograms = conf.get('timer_histograms',
+                                         'no').lower() in TRUE_VALUES
+        self.timer_percentiles = [
+            int(s) for s in conf.get('timer_percentiles',
+                                     '50,90,99').split(',') if s.strip()]
+        self.aggregator = Aggregator(self.timer_histograms,
+                                     self.timer_percentiles, self.emitter)
+        self.shared_aggregation = conf.get('shared_aggregation',
+                                           'no').lower() in TRUE_VALUES
+        if self.shared_aggregation:
+            self.shared_aggregator = SharedAggregator(
+                self.aggregator,
+                conf.get('shared_aggregation_path', '/dev/shm/informant-%s' %
+                         conf.get('bind_port', '8080')),
+                int(conf.get('shared_aggregation_size', '1048576')),
+                self.logger)
+        else:
+            self.shared_aggregator = None
+        self._flusher_running = False
+        self.async_events = conf.get('async_events',
+                                     'no').lower() in TRUE_VALUES
+        self.queue_size = int(conf.get('queue_size', '10000'))
+        self.queue_batch_size = int(conf.get('queue_batch_size', '100'))
+        self.event_queue = LightQueue(self.queue_size)
+        self.dropped_events = 0
+        self._sender_running = False
+        self.response_timing = conf.get('response_timing',
+                                        'no').lower() in TRUE_VALUES
+        self.upload_timing = conf.get('upload_timing',
+                                      'no').lower() in TRUE_VALUES
+        if conf.get('size_metrics', 'no').lower() in TRUE_VALUES:
+            self.size_buckets = SizeBuckets(
+                conf.get('size_buckets', DEFAULT_SIZE_BUCKETS))
+        else:
+            self.size_buckets = None
+        cardinality_limit = int(conf.get('cardinality_limit', '0'))
+        cardinality_limits = dict.fromkeys(DIMENSIONS, cardinality_limit)
+        for entry in conf.get('cardinality_limits', '').split(','):
+            if ':' in entry:
+                dimension, limit = entry.rsplit(':', 1)
+                if dimension.strip() not in DIMENSIONS:
+                    raise ValueError('Unknown cardinality dimension %r' %
+                                     dimension.strip())
+                cardinality_limits[dimension.strip()] = int(limit)
+        cardinality_limits = dict(
+            (dimension, limit) for dimension, limit in
+            cardinality_limits.iteritems() if limit > 0)
+        if cardinality_limits:
+            self.cardinality = CardinalityGuard(cardinality_limits)
+        else:
+            self.cardinality = None
+        self.top_accounts = int(conf.get('top_accounts', '0'))
+        self.top_accounts_capacity = int(conf.get(
+            'top_accounts_capacity', self.top_accounts * 4))
+        self.heavy_hitters = SpaceSaving(self.top_accounts_capacity)
+        self.distinct_counts = conf.get('distinct_counts',
+                                        'no').lower() in TRUE_VALUES
+        distinct_precision = int(conf.get('distinct_precision', '12'))
+        self.distinct_accounts = HyperLogLog(distinct_precision)
+        self.distinct_containers = HyperLogLog(distinct_precision)
+        self.distinct_objects = HyperLogLog(distinct_precision)
+        self.statsd_events = conf.get('statsd_events',
+                                      'yes').lower() in TRUE_VALUES
+        self.prometheus_path = conf.get('prometheus_path', '')
+        if self.prometheus_path:
+            buckets = conf.get('prometheus_buckets')
+            if buckets:
+                buckets = [float(b) for b in buckets.split(',') if b.strip()]
+            shared = conf.get('prometheus_shared',
+                              'yes').lower() in TRUE_VALUES
+            self.prometheus = PrometheusRegistry(
+                conf.get('prometheus_prefix', 'informant'),
+                buckets or DEFAULT_BUCKETS, worker_label=not shared)
+            if shared:
+                self.prometheus_shared = SharedRegistry(
+                    self.prometheus,
+                    conf.get('prometheus_shared_path',
+                             '/dev/shm/informant-prometheus-%s' %
+                             conf.get('bind_port', '8080')),
+                    int(conf.get('prometheus_shared_size', '1048576')),
+                    self.logger)
+            else:
+                self.prometheus_shared = None
+            # prometheus series are cumulative, values are folded against
+            # a guard that is never reset so the number of series per
+            # worker stays bounded
+            if cardinality_limits:
+                self.prometheus_cardinality = CardinalityGuard(
+                    cardinality_limits)
+            else:
+                self.prometheus_cardinality = None
+        else:
+            self.prometheus = None
+            self.prometheus_shared = None
+            self.prometheus_cardinality = None
+        # ms, infinite when disabled so fast requests only pay a comparison
+        self.slow_request_threshold = float(
+            conf.get('slow_request_threshold', '0')) or float('inf')
+        self.slow_requests = SlowRequestTracer(
+            int(conf.get('slow_request_buffer_size', '100')))
+        self.slow_request_path = conf.get('slow_request_path', '')
+        # the slow requests include other tenants' accounts and
+        # transaction ids, only serve them to these client addresses
+        self.slow_request_allowed_addrs = set(
+            s.strip() for s in conf.get('slow_request_allowed_addrs',
+                                        '127.0.0.1,::1').split(',')
+            if s.strip())
+        self.slow_request_file = conf.get('slow_request_file', '')
+        self._slow_requests_dumped = 0
+        self.template_cache_size = int(conf.get('template_cache_size',
+                                                '1024'))
+        self.templates = OrderedDict()
+        self.class_sample_rates = {}
+        for entry in conf.get('class_sample_rates', '').split(','):
+            if ':' in entry:
+                key, rate = entry.rsplit(':', 1)
+                self.class_sample_rates[key.strip()] = float(rate)
+        self.target_events_per_second = float(
+            conf.get('target_events_per_second', '0'))
+        self.adaptive_scale = 1.0
+        self._adaptive_window_start = time()
+        self._adaptive_window_events = 0
+        self._class_rates = {}
+        self._sample_credit = {}
+        self.subrequest_fanout = conf.get('subrequest_fanout',
+                                          'no').lower() in TRUE_VALUES
+        self.inflight_gauges = conf.get('inflight_gauges',
+                                        'no').lower() in TRUE_VALUES
+        self.inflight = InFlight()
+        self.hub_lag_monitor = conf.get('hub_lag_monitor',
+                                        'no').lower() in TRUE_VALUES
+        self.watchdog = HubWatchdog(float(conf.get('hub_lag_interval',
+                                                   '0.1')))
+        self.posthooks_added = 0
+        self.self_metrics = conf.get('self_metrics',
+                                     'no').lower() in TRUE_VALUES
+        # totals of our own overhead and losses, self_metrics reports how
+        # much they changed every flush_interval
+        self.statsd_event_calls = 0
+        self.statsd_event_time = 0.0
+        self.send_events_calls = 0
+        self.send_events_time = 0.0
+        self.send_errors = 0
+        self.dropped_lines = 0
+        self._self_metrics_last = {}
         self.counter = 0
-        self.monitored = 0
+        self.reported = 0
+
+    def _log_error(self, message, exc_info=True):
+        """
+        Log an error at most once every error_log_interval seconds per
+        message, counting how many were suppressed in between.
+        """
+        now = time()
+        if now - self._last_error_log.get(message, 0) < \
+                self.error_log_interval:
+            self._suppressed_errors[message] = \
+                self._suppressed_errors.get(message, 0) + 1
+            return
+        if len(self._last_error_log) >= self.template_cache_size:
+            self._last_error_log.clear()
+        self._last_error_log[message] = now
+        suppressed = self._suppressed_errors.pop(message, 0)
+        if suppressed:
+            message = '%s (%d similar errors suppressed)' % (message,
+                                                             suppressed)
+        self.logger.error(message, exc_info=exc_info)
 
     def _send_events(self, payloads, combined_events=False):
-        """Fire the udp events to statsd"""
+        """
+        Fire the events to statsd (or graphite). After repeated failures
+        events are dropped without trying to send them until the backoff
+        expires, the number of failures and dropped lines are sent once a
+        send succeeds again.
+        """
+        now = time()
+        if not self.backoff.allowed(now):
+            self.backoff.dropped += len(payloads)
+            self.dropped_lines += len(payloads)
+            return
+        start = monotonic()
         try:
-            udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            if not combined_events:
-                for payload in payloads:
-                    udp_socket.sendto(payload, self.statsd_addr)
+            self.sender.send(payloads, combined_events)
+        except Exception as err:
+            self.send_errors += 1
+            self.backoff.failure(now)
+            self.backoff.dropped += len(payloads)
+            self.dropped_lines += len(payloads)
+            self.sender.close()
+            self._log_error(_("Error sending statsd event: %s") % err,
+                            exc_info=False)
+            return
+        if self.backoff.errors:
+            errors, dropped, dropped_events = self.backoff.success()
+            self.logger.info(_("Sending statsd events recovered after %d "
+                               "errors, %d lines and %d events dropped") %
+                             (errors, dropped, dropped_events))
+            series = self.emitter.plain_series
+            counter = self.emitter.counter
+            try:
+                self.sender.send([
+                    counter(series(self.metric_name_prepend +
+                                   'informant.send_errors'), errors, now),
+                    counter(series(self.metric_name_prepend +
+                                   'informant.dropped_lines'), dropped,
+                            now),
+                    counter(series(self.metric_name_prepend +
+                                   'informant.dropped_events'),
+                            dropped_events, now)], combined_events)
+            except Exception:
+                pass
+        self.send_events_calls += 1
+        self.send_events_time += monotonic() - start
+
+    def _start_flusher(self):
+        """Start the aggregate flush greenthread if its not running yet"""
+        if not self._flusher_running:
+            self._flusher_running = True
+            spawn_n(self._flush_loop)
+
+    def _flush_loop(self):
+        """Periodically flush aggregated events to statsd"""
+        while True:
+            sleep(self.flush_interval)
+            self.flush_events()
+
+    def _top_accounts_lines(self):
+        """
+        Generate the lines for this interval's top accounts and reset the
+        heavy hitters sketch.
+
+        :returns: list of lines
+        """
+        lines = []
+        now = time()
+        series = self.emitter.plain_series
+        counter = self.emitter.counter
+        for acct, count, nbytes, errors in \
+                self.heavy_hitters.top(self.top_accounts):
+            # accounts come straight from client request paths
+            name = "%stop_accounts.%s" % (self.metric_name_prepend,
+                                          metric_safe(acct))
+            lines.append(counter(series(name + '.requests'), count, now))
+            lines.append(counter(series(name + '.bytes'), nbytes, now))
+            lines.append(counter(series(name + '.errors'), errors, now))
+        self.heavy_hitters.clear()
+        return lines
+
+    def _count_distinct(self, path):
+        """Add the account, container and object in path to the sketches"""
+        parts = path.split('/', 4)
+        if len(parts) < 3 or parts[1] not in ('v1', 'v1.0') or not parts[2]:
+            return
+        self.distinct_accounts.add(parts[2])
+        if len(parts) > 3 and parts[3]:
+            self.distinct_containers.add('/'.join(parts[2:4]))
+            if len(parts) > 4 and parts[4]:
+                self.distinct_objects.add('/'.join(parts[2:]))
+
+    def _distinct_lines(self):
+        """
+        Generate the lines for this interval's distinct counts and reset
+        the sketches.
+
+        :returns: list of lines
+        """
+        lines = []
+        now = time()
+        for name, sketch in (('accounts', self.distinct_accounts),
+                             ('containers', self.distinct_containers),
+                             ('objects', self.distinct_objects)):
+            lines.append(self.emitter.gauge(self.emitter.plain_series(
+                "%sdistinct.%s" % (self.metric_name_prepend, name)), '',
+                sketch.cardinality(), now))
+            sketch.clear()
+        return lines
+
+    def _self_metric_lines(self):
+        """
+        Generate gauges for informant's own overhead, losses and
+        occupancy over the last flush interval. Times are mean
+        microseconds per call and informant.actual_rate_ppm is the
+        fraction of requests that were reported, in parts per million.
+
+        :returns: list of lines
+        """
+        totals = {
+            'statsd_event.calls': self.statsd_event_calls,
+            'statsd_event.time': self.statsd_event_time,
+            'send_events.calls': self.send_events_calls,
+            'send_events.time': self.send_events_time,
+            'packets': self.sender.packets_sent,
+            'bytes': self.sender.bytes_sent,
+            'send_errors': self.send_errors,
+            'dropped_lines': self.dropped_lines,
+            'dropped_events': self.dropped_events,
+            'requests': self.counter,
+            'reported': self.reported}
+        last = self._self_metrics_last
+        delta = dict((key, value - last.get(key, 0))
+                     for key, value in totals.iteritems())
+        self._self_metrics_last = totals
+        gauges = [
+            ('statsd_event.calls', delta['statsd_event.calls']),
+            ('statsd_event.us', delta['statsd_event.time'] * 1000000 /
+             (delta['statsd_event.calls'] or 1)),
+            ('send_events.calls', delta['send_events.calls']),
+            ('send_events.us', delta['send_events.time'] * 1000000 /
+             (delta['send_events.calls'] or 1)),
+            ('packets', delta['packets']),
+            ('bytes', delta['bytes']),
+            ('send_errors', delta['send_errors']),
+            ('lines_dropped', delta['dropped_lines']),
+            ('events_dropped', delta['dropped_events']),
+            ('actual_rate_ppm', delta['reported'] * 1000000 /
+             (delta['requests'] or 1)),
+            ('queue', self.event_queue.qsize()),
+            ('templates', len(self.templates))]
+        now = time()
+        series = self.emitter.plain_series
+        gauge = self.emitter.gauge
+        prefix = self.metric_name_prepend + 'informant.'
+        return [gauge(series(prefix + name), '', value, now)
+                for name, value in gauges]
+
+    def _inflight_lines(self):
+        """
+        Generate the in flight and peak in flight gauges for this interval
+
+        :returns: list of lines
+        """
+        now = time()
+        emitter = self.emitter
+        prepend = self.metric_name_prepend
+        lines = []
+        total, total_peak = self.inflight.total, self.inflight.total_peak
+        for (stat_type, method), current, peak in self.inflight.take():
+            series = emitter.series(Metric(
+                "%sinflight.%s.%s" % (prepend, stat_type, method),
+                prepend + 'inflight',
+                (('type', stat_type), ('method', method))))
+            lines.append(emitter.gauge(series, '', current, now))
+            lines.append(emitter.gauge(series, '.peak', peak, now))
+        series = emitter.plain_series(prepend + 'inflight.total')
+        lines.append(emitter.gauge(series, '', total, now))
+        lines.append(emitter.gauge(series, '.peak', total_peak, now))
+        return lines
+
+    def _cardinality_lines(self):
+        """
+        Generate the counters of values folded into other by the
+        cardinality guard this interval, per dimension
+
+        :returns: list of lines
+        """
+        now = time()
+        emitter = self.emitter
+        prepend = self.metric_name_prepend
+        return [emitter.counter(emitter.series(Metric(
+            "%scardinality.folded.%s" % (prepend, dimension),
+            prepend + 'cardinality.folded', (('dimension', dimension),))),
+            folded, now)
+            for dimension, folded in sorted(self.cardinality.take().items())]
+
+    def start_watchdog(self):
+        """
+        Start the hub lag watchdog greenthread, it starts the flusher once
+        it's running in a worker.
+        """
+        self.watchdog.register()
+        spawn_n(self.watchdog.run, self._start_flusher)
+
+    def _watchdog_lines(self):
+        """
+        Generate the hub lag percentile (in microseconds), waiting
+        greenthread and pending posthook gauges for this interval
+
+        :returns: list of lines
+        """
+        now = time()
+        series = self.emitter.plain_series
+        gauge = self.emitter.gauge
+        prepend = self.metric_name_prepend
+        lags = self.watchdog.take()
+        name = series(prepend + 'hub.lag_us')
+        lines = [gauge(name, '.count', lags.count, now),
+                 gauge(name, '.max', lags.max, now)]
+        percentiles = sorted(self.timer_percentiles)
+        for percentile, value in zip(percentiles,
+                                     lags.percentiles(percentiles)):
+            lines.append(gauge(name, '.p%s' % percentile, value, now))
+        timers, fds = hub_waiting()
+        lines.append(gauge(series(prepend + 'hub.waiting_timers'), '',
+                           timers, now))
+        lines.append(gauge(series(prepend + 'hub.waiting_fds'), '', fds,
+                           now))
+        lines.append(gauge(series(prepend + 'hub.pending_posthooks'), '',
+                           self.posthooks_added - self.statsd_event_calls,
+                           now))
+        return lines
+
+    def flush_events(self):
+        """Send any aggregated events and periodic stats to statsd"""
+        try:
+            if self.shared_aggregator:
+                payloads = self.shared_aggregator.flush()
             else:
-                #send multiple events per packet
-                payload = self.combine_key.join(payloads)
-                udp_socket.sendto(payload, self.statsd_addr)
+                payloads = self.aggregator.flush()
+            if self.top_accounts:
+                payloads.extend(self._top_accounts_lines())
+            if self.distinct_counts:
+                payloads.extend(self._distinct_lines())
+            if self.prometheus_shared:
+                self.prometheus_shared.publish()
+            if self.inflight_gauges:
+                payloads.extend(self._inflight_lines())
+            if self.cardinality is not None:
+                payloads.extend(self._cardinality_lines())
+            if self.hub_lag_monitor:
+                payloads.extend(self._watchdog_lines())
+            if self.self_metrics:
+                payloads.extend(self._self_metric_lines())
+            if payloads:
+                self._send_events(payloads, self.combined_events)
+            if self.slow_request_file and \
+                    self.slow_requests.recorded != self._slow_requests_dumped:
+                self._slow_requests_dumped = self.slow_requests.recorded
+                self.slow_requests.dump_to_file(self.slow_request_file)
         except Exception:
-            self.logger.exception(_("Error sending statsd event"))
+            self.logger.exception(_("Error flushing aggregated events"))
+
+    def _request_class(self, env):
+        """
+        Classify a request from its environ
+
+        :returns: tuple of (stat_type, method, account)
+        """
+        return classify(env['REQUEST_METHOD'], env['PATH_INFO'],
+                        env.get('swift.source'), self.valid_methods)
+
+    def _lookup_rate(self, stat_type, method, status_class):
+        """
+        Find the configured sample rate for a request class, the most
+        specific class_sample_rates entry wins and entries including the
+        status class are preferred. A status_class of None only matches
+        the entries without one.
+        """
+        keys = ['%s.%s' % (stat_type, method), stat_type]
+        if status_class:
+            keys[:0] = ['%s.%s.%s' % (stat_type, method, status_class),
+                        '%s.%s' % (stat_type, status_class), status_class]
+        for key in keys:
+            if key in self.class_sample_rates:
+                return self.class_sample_rates[key]
+        return self.statsd_sample_rate
+
+    def _class_rate(self, stat_type, method, status_class=None):
+        """
+        The (cached) sample rate for a request class. Without a
+        status_class this is the highest rate any response to the request
+        could be sampled at.
+        """
+        key = (stat_type, method, status_class)
+        rate = self._class_rates.get(key)
+        if rate is None:
+            if status_class is None:
+                rate = max(self._lookup_rate(stat_type, method, c)
+                           for c in STATUS_CLASSES + (None,))
+            else:
+                rate = self._lookup_rate(stat_type, method, status_class)
+            if len(self._class_rates) >= self.template_cache_size:
+                self._class_rates.clear()
+            self._class_rates[key] = rate
+        return rate
+
+    def _sample(self, key, rate):
+        """
+        Deterministically pick a rate fraction of the calls made with key,
+        starting with the first one.
 
-    def _send_sampled_event(self):
+        :returns: True if this call was picked
+        """
+        if rate >= 1:
+            return True
+        if rate <= 0:
+            return False
+        credit = self._sample_credit.get(key, 1.0 - rate) + rate
+        if credit >= 1:
+            credit -= 1
+            sampled = True
+        else:
+            sampled = False
+        if key not in self._sample_credit and \
+                len(self._sample_credit) >= self.template_cache_size:
+            self._sample_credit.clear()
+        self._sample_credit[key] = credit
+        return sampled
+
+    def _adapt_sample_rate(self):
+        """
+        Halve or double adaptive_scale so the rate of reported events
+        stays within target_events_per_second.
+        """
+        now = time()
+        elapsed = now - self._adaptive_window_start
+        if elapsed < 1:
+            return
+        events_per_second = \
+            (self.reported - self._adaptive_window_events) / elapsed
+        if events_per_second > self.target_events_per_second:
+            self.adaptive_scale = max(self.adaptive_scale / 2,
+                                      MIN_ADAPTIVE_SCALE)
+        elif events_per_second * 2 <= self.target_events_per_second:
+            self.adaptive_scale = min(self.adaptive_scale * 2, 1.0)
+        self._adaptive_window_start = now
+        self._adaptive_window_events = self.reported
+
+    def _send_sampled_event(self, env):
         """"
-        Track the sample rate and checks to see if this is a request
-        that should be sent to statsd.
+        Checks to see if this is a request that should be sent to statsd.
+        With class_sample_rates this samples at the highest rate the
+        request could be reported at, statsd_event then samples again
+        once the response status is known.
 
         :returns: True if the event should be sent to statsd
         """
-        send_sample = False
         self.counter += 1
-        if self.actual_rate < self.statsd_sample_rate:
-            self.monitored += 1
-            send_sample = True
-        self.actual_rate = float(self.monitored) / float(self.counter)
-        if self.counter >= maxint or self.monitored >= maxint:
-            self.counter = 0
-            self.monitored = 0
-        return send_sample
+        if self.target_events_per_second and not self.counter & 127:
+            self._adapt_sample_rate()
+        if self.class_sample_rates:
+            stat_type, method, _junk = self._request_class(env)
+            key = (stat_type, method)
+            rate = self._class_rate(stat_type, method)
+        else:
+            key = None
+            rate = self.statsd_sample_rate
+        rate *= self.adaptive_scale
+        if self._sample(key, rate):
+            env['informant.sample_rate'] = rate
+            return True
+        return False
+
+    def _event_record(self, env, req):
+        """
+        Collect everything we need to know about this request into a
+        compact EventRecord.
+        """
+        stat_type, request_method, acct = self._request_class(env)
+        status_int, duration, start_response_time, transferred = \
+            self._request_outcome(env, req)
+        ttfb = ttlb = send_rate = None
+        timer = env.get('informant.response_timer')
+        if timer is not None and timer.first_byte_time is not None:
+            start_time = env['informant.start_time']
+            last_byte_time = timer.last_byte_time or time()
+            ttfb = (timer.first_byte_time - start_time) * 1000
+            ttlb = (last_byte_time - start_time) * 1000
+            if last_byte_time > timer.first_byte_time:
+                # bytes per second while streaming the body
+                send_rate = timer.bytes_sent / \
+                    (last_byte_time - timer.first_byte_time)
+        upload_rate = upload_stall = None
+        input_timer = env.get('informant.input_timer')
+        if input_timer is not None and input_timer.bytes_read:
+            upload_stall = input_timer.read_time * 1000
+            upload_time = input_timer.last_read_time - \
+                input_timer.first_read_time
+            if upload_time > 0:
+                upload_rate = input_timer.bytes_read / upload_time
+        size_bucket = ms_per_mb = None
+        if self.size_buckets is not None and stat_type == 'obj':
+            size_bucket = self.size_buckets.label(
+                self._object_size(env, request_method, int(transferred)))
+            if transferred:
+                ms_per_mb = duration * 1048576 / int(transferred)
+        subrequests = None
+        context = env.get('informant.fanout')
+        if context is not None:
+            fanout.unregister(context)
+            subrequests = context.summary() or None
+        return EventRecord(stat_type, request_method, status_int, duration,
+                           start_response_time, transferred, acct,
+                           ttfb, ttlb, send_rate, upload_rate, upload_stall,
+                           env.get('informant.sample_rate',
+                                   self.statsd_sample_rate), subrequests,
+                           size_bucket, ms_per_mb)
+
+    def _request_outcome(self, env, req):
+        """
+        :returns: tuple of (status, duration, start response time,
+                  bytes transferred), times are in milliseconds
+        """
+        if 'informant.status' in env:
+            status_int = env['informant.status']
+            response = getattr(req, 'response', None)
+            if getattr(req, 'client_disconnect', False) or \
+                    getattr(response, 'client_disconnect', False):
+                status_int = 499
+        else:
+            #start_response never got called for some reason, likely
+            #because something else blew up but we don't know for sure.
+            status_int = 599
+            response = None
+        if 'informant.start_time' in env:
+            duration = (time() - env['informant.start_time']) * 1000
+            if 'informant.start_response_time' in env:
+                start_response_time = \
+                    (env['informant.start_response_time'] -
+                     env['informant.start_time']) * 1000
+            else:
+                start_response_time = 0
+        else:
+            duration = 0
+            start_response_time = 0
+        transferred = getattr(req, 'bytes_transferred', 0)
+        if transferred is '-' or transferred is 0:
+            transferred = getattr(response, 'bytes_transferred', 0)
+        if transferred is '-':
+            transferred = 0
+        return status_int, duration, start_response_time, int(transferred)
+
+    def _object_size(self, env, method, transferred):
+        """
+        The size of the object a request uploaded or downloaded, from the
+        request's Content-Length for uploads and the response's otherwise,
+        falling back to the bytes actually transferred.
+        """
+        if method in ('PUT', 'POST'):
+            length = env.get('CONTENT_LENGTH')
+        else:
+            length = env.get('informant.content_length')
+        try:
+            return int(length)
+        except (TypeError, ValueError):
+            return transferred
+
+    def _stat_templates(self, record):
+        """
+        Look up (or build and cache) the metric series and line templates
+        for an EventRecord's stat_type, method, status and prefixed
+        account. The cache holds at most template_cache_size entries, the
+        oldest entry is evicted when it's full.
+
+        :returns: tuple of (series, type, line template, record field)
+                  tuples, a field of None means the value is always 1
+        """
+        acct = record.acct
+        if acct not in self.prefix_accounts:
+            acct = None
+        key = (record.stat_type, record.method, record.status, acct,
+               record.rate, record.size_bucket)
+        templates = self.templates.get(key)
+        if templates is not None:
+            return templates
+        metrics = metric_specs(
+            record, self.metric_name_prepend, self.prefix_accounts,
+            self.prefix_accounts_metric_prepend, self.response_timing,
+            self.upload_timing)
+        emitter = self.emitter
+        templates = []
+        for metric, stat_type, field in metrics:
+            series = emitter.series(metric)
+            templates.append((series, stat_type,
+                              emitter.template(series, stat_type,
+                                               record.rate), field))
+        templates = tuple(templates)
+        if len(self.templates) >= self.template_cache_size:
+            self.templates.popitem(last=False)
+        self.templates[key] = templates
+        return templates
+
+    def _record_stats(self, record):
+        """
+        Generate the stats for an EventRecord
+
+        :returns: list of (series, value, type) tuples
+        """
+        stats = record_stats(record, self._stat_templates(record))
+        if record.subrequests:
+            series = self.emitter.series
+            for metric, stat_type, value in fanout_specs(
+                    record, self.metric_name_prepend):
+                stats.append((series(metric), value, stat_type))
+        return stats
+
+    def _record_lines(self, record):
+        """
+        Generate the statsd lines for an EventRecord
+
+        :returns: list of statsd lines
+        """
+        lines = []
+        for _junk, _junk, template, field in self._stat_templates(record):
+            if field is None:
+                lines.append(template % 1)
+            else:
+                value = getattr(record, field)
+                if value is not None:
+                    lines.append(template % value)
+        if record.subrequests:
+            emitter = self.emitter
+            for metric, stat_type, value in fanout_specs(
+                    record, self.metric_name_prepend):
+                lines.append(emitter.template(emitter.series(metric),
+                                              stat_type, record.rate) % value)
+        return lines
+
+    def _emit_records(self, records):
+        """Aggregate or send the stats for a list of EventRecords"""
+        if self.self_metrics:
+            self._start_flusher()
+        if self.top_accounts:
+            self._start_flusher()
+            for record in records:
+                if record.acct:
+                    self.heavy_hitters.update(
+                        record.acct, 1 / record.rate,
+                        record.transferred / record.rate,
+                        record.status >= 500)
+        if not self.statsd_events:
+            return
+        if self.cardinality is not None:
+            self._start_flusher()
+            fold_record = self.cardinality.fold_record
+            records = [fold_record(record) for record in records]
+        if self.aggregate_events:
+            self._start_flusher()
+            for record in records:
+                self.aggregator.add(self._record_stats(record), record.rate)
+        elif not self.backoff.allowed(time()):
+            # don't bother formatting lines that would only be dropped
+            self.backoff.dropped_events += len(records)
+            self.dropped_events += len(records)
+        else:
+            metrics = []
+            for record in records:
+                metrics.extend(self._record_lines(record))
+            self._send_events(metrics, self.combined_events)
+
+    def _queue_record(self, record):
+        """
+        Queue an EventRecord for the sender greenthread, dropping it if
+        the queue is full.
+        """
+        if not self._sender_running:
+            self._sender_running = True
+            spawn_n(self._sender_loop)
+        try:
+            self.event_queue.put_nowait(record)
+        except Full:
+            self.dropped_events += 1
+
+    def _sender_loop(self):
+        """Drain queued EventRecords in batches and emit them"""
+        while True:
+            records = [self.event_queue.get()]
+            try:
+                while len(records) < self.queue_batch_size:
+                    records.append(self.event_queue.get_nowait())
+            except Empty:
+                pass
+            try:
+                self._emit_records(records)
+            except Exception:
+                self.logger.exception(_("Error emitting queued events"))
+
+    def _trace_slow_request(self, env, record):
+        """Add a request over slow_request_threshold to the ring buffer"""
+        self.slow_requests.record(SlowRequest(
+            time(), env.get('swift.trans_id'), record.method,
+            record.stat_type, record.acct, record.status,
+            record.start_response_time, record.duration,
+            record.transferred))
+        if self.slow_request_file:
+            self._start_flusher()
+
+    def _observe_request(self, env, record):
+        """
+        Check a request, sampled or not, against slow_request_threshold
+        and count it in the prometheus metrics
+        """
+        if record.duration > self.slow_request_threshold:
+            self._trace_slow_request(env, record)
+        if not self.prometheus:
+            return
+        if self.prometheus_shared:
+            self._start_flusher()
+        if self.prometheus_cardinality is not None:
+            record = self.prometheus_cardinality.fold_record(record)
+        self.prometheus.observe(
+            record.stat_type, record.method, record.status,
+            record.duration / 1000.0, record.start_response_time / 1000.0,
+            record.transferred)
+
+    def unsampled_event(self, env, req):
+        """
+        Check a request that wasn't sampled for statsd for slowness and
+        count it in the prometheus metrics, which have to be exact
+        """
+        try:
+            stat_type, method, acct = self._request_class(env)
+            status, duration, start_response_time, transferred = \
+                self._request_outcome(env, req)
+            self._observe_request(env, EventRecord(
+                stat_type, method, status, duration, start_response_time,
+                transferred, acct))
+        except Exception:
+            try:
+                self._log_error(_("Encountered error in unsampled_event"))
+            except Exception:
+                pass
 
     def statsd_event(self, env, req):
-        """generate a statsd event for this request"""
+        """generate a statsd event for this (sampled) request"""
+        start = monotonic()
         try:
-            if self._send_sampled_event():
-                request_method = req.method.upper()
-                if request_method not in self.valid_methods:
-                    request_method = "BAD_METHOD"
-                if 'informant.status' in env:
-                    status_int = env['informant.status']
-                    response = getattr(req, 'response', None)
-                    if getattr(req, 'client_disconnect', False) or \
-                            getattr(response, 'client_disconnect', False):
-                        status_int = 499
-                else:
-                    #start_response never got called for some reason, likely
-                    #because something else blew up but we don't know for sure.
-                    status_int = 599
-                if 'informant.start_time' in env:
-                    duration = (time() - env['informant.start_time']) * 1000
-                    if 'informant.start_response_time' in env:
-                        start_response_time = \
-                            (env['informant.start_response_time'] -
-                             env['informant.start_time']) * 1000
-                    else:
-                        start_response_time = 0
-                else:
-                    duration = 0
-                    start_response_time = 0
-                transferred = getattr(req, 'bytes_transferred', 0)
-                if transferred is '-' or transferred is 0:
-                    transferred = getattr(response, 'bytes_transferred', 0)
-                if transferred is '-':
-                    transferred = 0
-                stat_type = env.get('swift.source')
-                if not stat_type:
-                    if req.path == '/healthcheck':
-                        stat_type = 'healthcheck'
-                    elif req.path.startswith('/v1/') or \
-                            req.path.startswith('/v1.0/'):
-                        try:
-                            stat_type = [
-                                'invalid', 'invalid', 'acct', 'cont',
-                                'obj'][req.path.rstrip('/').count('/')]
-                        except IndexError:
-                            stat_type = 'obj'
-                if not stat_type:
-                    stat_type = 'invalid'
-                if stat_type not in ['acct', 'cont', 'obj']:
-                    acct = None
-                else:
-                    try:
-                        version, acct, _junk = split_path(req.path, 1, 3, True)
-                    except ValueError:
-                        acct = None
-                metrics = []
-                name = "%s.%s.%s" % (stat_type, request_method,
-                                     status_int)
-                metrics.append("%s%s:1|c|@%s" %
-                               (self.metric_name_prepend, name,
-                                self.statsd_sample_rate))
-                metrics.append("%s%s:%d|ms|@%s" %
-                               (self.metric_name_prepend, name, duration,
-                                self.statsd_sample_rate))
-                metrics.append("%ssrt.%s:%d|ms|@%s" %
-                               (self.metric_name_prepend, name,
-                                start_response_time, self.statsd_sample_rate))
-                metrics.append("%stfer.%s:%s|c|@%s" %
-                               (self.metric_name_prepend, name, transferred,
-                                self.statsd_sample_rate))
-                if acct in self.prefix_accounts:
-                    metrics.append("%s%s.%s.%s.%s:1|c|@%s" %
-                                   (self.prefix_accounts_metric_prepend,
-                                    acct, stat_type, request_method,
-                                    status_int, self.statsd_sample_rate))
-                    metrics.append("%s%s.%s:%d|ms|@%s" %
-                                   (self.prefix_accounts_metric_prepend,
-                                    acct, stat_type, duration,
-                                    self.statsd_sample_rate))
-                    metrics.append("%s%s.srt.%s:%d|ms|@%s" %
-                                   (self.prefix_accounts_metric_prepend,
-                                    acct, name, start_response_time,
-                                    self.statsd_sample_rate))
-                self._send_events(metrics, self.combined_events)
+            record = self._event_record(env, req)
+            self._observe_request(env, record)
+            if self.class_sample_rates:
+                rate = self._class_rate(
+                    record.stat_type, record.method,
+                    '%dxx' % (record.status // 100)) * self.adaptive_scale
+                if rate < record.rate:
+                    if not self._sample(record[:3], rate / record.rate):
+                        return
+                    record = record._replace(rate=rate)
+            self.reported += 1
+            if self.async_events:
+                self._queue_record(record)
+            else:
+                self._emit_records([record])
         except Exception:
             try:
-                self.logger.exception(_("Encountered error in statsd_event"))
+                self._log_error(_("Encountered error in statsd_event"))
             except Exception:
                 pass
+        finally:
+            self.statsd_event_calls += 1
+            self.statsd_event_time += monotonic() - start
+
+    def _serve(self, env, start_response, render, content_type):
+        """Respond to an admin path with the body returned by render()"""
+        if env['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            start_response('405 Method Not Allowed',
+                           [('Content-Length', '0'), ('Allow', 'GET, HEAD')])
+            return []
+        body = render()
+        start_response('200 OK', [('Content-Type', content_type),
+                                  ('Content-Length', str(len(body)))])
+        if env['REQUEST_METHOD'] == 'HEAD':
+            return []
+        return [body]
 
     def __call__(self, env, start_response):
+        if self.prometheus and env['PATH_INFO'] == self.prometheus_path:
+            return self._serve(env, start_response,
+                               (self.prometheus_shared or
+                                self.prometheus).render, CONTENT_TYPE)
+        if self.slow_request_path and \
+                env['PATH_INFO'] == self.slow_request_path:
+            if env.get('REMOTE_ADDR') not in self.slow_request_allowed_addrs:
+                start_response('403 Forbidden', [('Content-Length', '0')])
+                return []
+            return self._serve(env, start_response, self.slow_requests.dump,
+                               'application/json')
+        if self.inflight_gauges:
+            return self._call_inflight(env, start_response)
+        return self._call(env, start_response)
+
+    def _call_inflight(self, env, start_response):
+        """Count the request as in flight until its response is closed"""
+        self._start_flusher()
+        stat_type, method, _junk = self._request_class(env)
+        if self.cardinality is not None:
+            stat_type = self.cardinality.fold('type', stat_type)
+        request = InFlightRequest(self.inflight, (stat_type, method))
+        if 'eventlet.posthooks' in env:
+            # in case the server never closes the response
+            env['eventlet.posthooks'].append((request.finish, (), {}))
+        try:
+            request.app_iter = self._call(env, start_response)
+        except BaseException:
+            request.finish()
+            raise
+        return request
+
+    def _call(self, env, start_response):
+        """Set up the monitoring of a request and pass it on"""
 
         def _start_response(status, headers, exc_info=None):
             """start_response wrapper to add request status to env"""
             env['informant.status'] = int(status.split(' ', 1)[0])
             env['informant.start_response_time'] = time()
+            if self.size_buckets is not None:
+                for header, value in headers:
+                    if header.lower() == 'content-length':
+                        env['informant.content_length'] = value
+                        break
             start_response(status, headers, exc_info)
 
-        req = Request(env)
         try:
-            if 'eventlet.posthooks' in env:
+            if self.distinct_counts:
+                self._start_flusher()
+                self._count_distinct(env['PATH_INFO'])
+            if 'eventlet.posthooks' in env and \
+                    self._send_sampled_event(env):
+                env['informant.start_time'] = time()
+                env['eventlet.posthooks'].append(
+                    (self.statsd_event, (Request(env),), {}))
+                self.posthooks_added += 1
+                if self.subrequest_fanout:
+                    env['informant.fanout'] = fanout.FanOut()
+                if self.upload_timing and 'wsgi.input' in env and \
+                        env['REQUEST_METHOD'] in ('PUT', 'POST'):
+                    env['wsgi.input'] = env['informant.input_timer'] = \
+                        InputTimer(env['wsgi.input'])
+                if self.response_timing:
+                    timer = ResponseTimer(self.app(env, _start_response))
+                    env['informant.response_timer'] = timer
+                    return timer
+            elif 'eventlet.posthooks' in env and (
+                    self.prometheus or
+                    self.slow_request_threshold < float('inf')):
                 env['informant.start_time'] = time()
                 env['eventlet.posthooks'].append(
-                    (self.statsd_event, (req,), {}))
+                    (self.unsampled_event, (Request(env),), {}))
             return self.app(env, _start_response)
         except Exception:
             self.logger.exception('WSGI EXCEPTION:')
@@ -195,5 +1034,8 @@ def filter_factory(global_conf, **local_conf):
     conf.update(local_conf)
 
     def informant_filter(app):
-        return Informant(app, conf)
+        informant = Informant(app, conf)
+        if informant.hub_lag_monitor:
+            informant.start_watchdog()
+        return informant
     return informant_filter
@@ -0,0 +1,261 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from bisect import bisect_left
+
+from informant.shared import SharedRegion
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def escape_label(value):
+    """Escape a label value for the prometheus text format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+class Series(object):
+    """
+    The counters and latency histograms for one
+    (stat_type, method, status) label set. The text for each metric family
+    is cached and only rendered again after the series is updated.
+    """
+
+    def __init__(self, labels, buckets):
+        self.labels = labels
+        self.requests = 0
+        self.bytes = 0
+        # per bucket (not cumulative) counts with a trailing +Inf bucket
+        self.duration_buckets = [0] * (len(buckets) + 1)
+        self.duration_sum = 0
+        self.srt_buckets = [0] * (len(buckets) + 1)
+        self.srt_sum = 0
+        self.rendered = None
+
+
+class PrometheusRegistry(object):
+    """
+    Keeps request counters and latency histograms in memory and renders
+    them in the prometheus text exposition format.
+
+    :param worker_label: label every series with the pid of the worker
+                         process, for when each worker is scraped on its own
+    """
+
+    def __init__(self, prefix='informant', buckets=DEFAULT_BUCKETS,
+                 worker_label=False):
+        self.prefix = prefix
+        self.buckets = sorted(buckets)
+        self.bucket_labels = ['%s' % b for b in self.buckets] + ['+Inf']
+        self.worker_label = worker_label
+        self.series = {}
+
+    def _new_series(self, key):
+        labels = 'type="%s",method="%s",status="%s"' % tuple(
+            escape_label(v) for v in key)
+        if self.worker_label:
+            labels += ',worker="%d"' % os.getpid()
+        return Series(labels, self.buckets)
+
+    def _series(self, key):
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = self._new_series(key)
+        return series
+
+    def observe(self, stat_type, method, status, duration, srt, nbytes):
+        """Record a request, durations are in seconds"""
+        series = self._series((stat_type, method, status))
+        series.requests += 1
+        series.bytes += nbytes
+        series.duration_buckets[bisect_left(self.buckets, duration)] += 1
+        series.duration_sum += duration
+        series.srt_buckets[bisect_left(self.buckets, srt)] += 1
+        series.srt_sum += srt
+        series.rendered = None
+
+    def _render_histogram(self, name, labels, buckets, total):
+        lines = []
+        count = 0
+        for le, bucket_count in zip(self.bucket_labels, buckets):
+            count += bucket_count
+            lines.append('%s_bucket{%s,le="%s"} %.15g\n' %
+                         (name, labels, le, count))
+        lines.append('%s_sum{%s} %.15g\n' % (name, labels, total))
+        lines.append('%s_count{%s} %.15g\n' % (name, labels, count))
+        return ''.join(lines)
+
+    def _render_series(self, series):
+        """:returns: the series' text for each metric family"""
+        if series.rendered is None:
+            prefix = self.prefix
+            series.rendered = (
+                '%s_requests_total{%s} %.15g\n' % (
+                    prefix, series.labels, series.requests),
+                '%s_transferred_bytes_total{%s} %.15g\n' % (
+                    prefix, series.labels, series.bytes),
+                self._render_histogram(
+                    prefix + '_request_duration_seconds', series.labels,
+                    series.duration_buckets, series.duration_sum),
+                self._render_histogram(
+                    prefix + '_start_response_seconds', series.labels,
+                    series.srt_buckets, series.srt_sum))
+        return series.rendered
+
+    def take(self):
+        """
+        Reset the series and return them as plain data (so they can be
+        marshaled and merged with the series of other workers).
+
+        :returns: dict of (stat_type, method, status) to lists of
+                  requests, bytes, duration buckets, duration sum, start
+                  response buckets and start response sum
+        """
+        series, self.series = self.series, {}
+        return dict((key, [s.requests, s.bytes, s.duration_buckets,
+                           s.duration_sum, s.srt_buckets, s.srt_sum])
+                    for key, s in series.iteritems())
+
+    def merge(self, state, other):
+        """Add the series taken from another registry to state"""
+        for key, values in other.iteritems():
+            mine = state.get(key)
+            if mine is None or len(mine[2]) != len(values[2]):
+                # new, or left behind with other buckets configured
+                state[key] = [values[0], values[1], list(values[2]),
+                              values[3], list(values[4]), values[5]]
+                continue
+            mine[0] += values[0]
+            mine[1] += values[1]
+            mine[2] = [a + b for a, b in zip(mine[2], values[2])]
+            mine[3] += values[3]
+            mine[4] = [a + b for a, b in zip(mine[4], values[4])]
+            mine[5] += values[5]
+        return state
+
+    def restore(self, state):
+        """Add series that were taken back to the registry"""
+        for key, values in state.iteritems():
+            series = self._series(key)
+            series.requests += values[0]
+            series.bytes += values[1]
+            series.duration_buckets = [
+                a + b for a, b in zip(series.duration_buckets, values[2])]
+            series.duration_sum += values[3]
+            series.srt_buckets = [
+                a + b for a, b in zip(series.srt_buckets, values[4])]
+            series.srt_sum += values[5]
+            series.rendered = None
+
+    def render_state(self, state, cache=None):
+        """
+        :param cache: dict of (stat_type, method, status) to the values
+                      and Series of the last call, series whose values
+                      haven't changed since are not rendered again. It's
+                      updated to only hold the series in state.
+        :returns: the series in state in the prometheus text format
+        """
+        if cache is None:
+            cache = {}
+        series_list = []
+        for key, values in state.iteritems():
+            cached = cache.get(key)
+            if cached is not None and cached[0] == values:
+                series_list.append(cached[1])
+                continue
+            series = self._new_series(key)
+            (series.requests, series.bytes, series.duration_buckets,
+             series.duration_sum, series.srt_buckets,
+             series.srt_sum) = values
+            cache[key] = (values, series)
+            series_list.append(series)
+        if len(cache) > len(state):
+            for key in set(cache).difference(state):
+                del cache[key]
+        return self._render(series_list)
+
+    def render(self):
+        """:returns: all metrics in the prometheus text format"""
+        return self._render(self.series.itervalues())
+
+    def _render(self, series_list):
+        rendered = [self._render_series(series) for series in series_list]
+        families = (
+            ('requests_total', 'counter', 'Requests handled'),
+            ('transferred_bytes_total', 'counter', 'Bytes transferred'),
+            ('request_duration_seconds', 'histogram',
+             'Time until the request finished'),
+            ('start_response_seconds', 'histogram',
+             'Time until start_response was called'))
+        output = []
+        for i, (name, metric_type, description) in enumerate(families):
+            output.append('# HELP %s_%s %s\n' % (self.prefix, name,
+                                                 description))
+            output.append('# TYPE %s_%s %s\n' % (self.prefix, name,
+                                                 metric_type))
+            output.extend(texts[i] for texts in rendered)
+        return ''.join(output)
+
+
+class SharedRegistry(SharedRegion):
+    """
+    Node wide prometheus metrics: every worker adds its series to totals
+    kept in a SharedRegion once per flush interval and whenever it
+    answers a scrape, so whichever worker accepts a scrape serves the
+    same monotonic totals for the whole node. The totals outlive the
+    workers, they are only lost if the region file is removed.
+    """
+
+    magic = 'INFP'
+
+    def __init__(self, registry, path, size=1048576, logger=None):
+        super(SharedRegistry, self).__init__(path, size, logger)
+        self.registry = registry
+        self.overflowed = False
+        # the values and Series last rendered for each key
+        self.rendered = {}
+
+    def _empty(self):
+        return {}
+
+    def publish(self):
+        """
+        Add this worker's series to the node totals
+
+        :returns: the node totals
+        """
+        self._lock()
+        try:
+            shared = self._read()
+            if not self.registry.series:
+                # nothing to add, leave the region alone
+                return shared
+            pending = self.registry.take()
+            shared = self.registry.merge(shared, pending)
+            if not self._write(shared):
+                # keep them to try again, they're still served this time
+                self.registry.restore(pending)
+                if not self.overflowed and self.logger:
+                    self.logger.error('Prometheus series do not fit in %s'
+                                      % self.path)
+                self.overflowed = True
+        finally:
+            self._unlock()
+        return shared
+
+    def render(self):
+        """:returns: the node totals in the prometheus text format"""
+        return self.registry.render_state(self.publish(), self.rendered)
@@ -0,0 +1,217 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from eventlet.green import socket
+
+
+class StatsdSender(object):
+    """
+    Long lived UDP sender for statsd events. The statsd address is resolved
+    and the socket is created on first use (so after the proxy workers have
+    forked) and then reused for every send.
+    """
+
+    def __init__(self, host, port, max_packet_size=1432, combine_key='\n'):
+        self.host = host
+        self.port = port
+        self.max_packet_size = max_packet_size
+        self.combine_key = combine_key
+        self.addr = None
+        self.sock = None
+        self.packets_sent = 0
+        self.bytes_sent = 0
+
+    def _connect(self):
+        """Resolve the statsd host and create our udp socket"""
+        family, _junk, _junk, _junk, addr = socket.getaddrinfo(
+            self.host, self.port, socket.AF_UNSPEC, socket.SOCK_DGRAM)[0]
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.addr = addr
+
+    def packets(self, payloads):
+        """
+        Pack payloads into groups whose combined size (including the
+        combine_key between them) fits into max_packet_size. A single
+        payload larger than max_packet_size is sent in a packet by itself.
+
+        :returns: generator of lists of payloads
+        """
+        packet = []
+        size = 0
+        key_len = len(self.combine_key)
+        for payload in payloads:
+            payload_len = len(payload)
+            if packet and size + key_len + payload_len > self.max_packet_size:
+                yield packet
+                packet = []
+                size = 0
+            if packet:
+                size += key_len
+            packet.append(payload)
+            size += payload_len
+        if packet:
+            yield packet
+
+    def _send_packet(self, packet):
+        """Send a list of payloads as a single datagram"""
+        if hasattr(self.sock, 'sendmsg'):
+            buffers = [self.combine_key] * (len(packet) * 2 - 1)
+            buffers[::2] = packet
+            self.bytes_sent += self.sock.sendmsg(buffers, (), 0, self.addr)
+        else:
+            self.bytes_sent += self.sock.sendto(
+                self.combine_key.join(packet), self.addr)
+        self.packets_sent += 1
+
+    def send(self, payloads, combined_events=False):
+        """
+        Fire the udp events to statsd, one event per packet or with
+        multiple events per packet if combined_events is set.
+        """
+        if self.sock is None:
+            self._connect()
+        if not combined_events:
+            for payload in payloads:
+                self.bytes_sent += self.sock.sendto(payload, self.addr)
+                self.packets_sent += 1
+        else:
+            for packet in self.packets(payloads):
+                self._send_packet(packet)
+
+    def close(self):
+        """Close our socket, it will be recreated on the next send"""
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+class GraphiteSender(object):
+    """
+    Sends graphite plaintext lines over a pool of TCP connections. Lines
+    are written in batches of up to max_batch_size bytes, a connection is
+    closed and dropped from the pool on any error and a new one is made
+    for the next send.
+    """
+
+    def __init__(self, host, port, max_batch_size=65536, pool_size=2,
+                 timeout=5):
+        self.host = host
+        self.port = port
+        self.max_batch_size = max_batch_size
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.pool = []
+        self.packets_sent = 0
+        self.bytes_sent = 0
+
+    def _connect(self):
+        """Make a new connection to the graphite host"""
+        family, socktype, proto, _junk, addr = socket.getaddrinfo(
+            self.host, self.port, socket.AF_UNSPEC, socket.SOCK_STREAM)[0]
+        sock = socket.socket(family, socktype, proto)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(addr)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def batches(self, payloads):
+        """
+        Join newline terminated payloads into batches of at most
+        max_batch_size bytes (a larger payload is a batch by itself).
+
+        :returns: generator of strings
+        """
+        batch = []
+        size = 0
+        for payload in payloads:
+            if batch and size + len(payload) + 1 > self.max_batch_size:
+                yield ''.join(batch)
+                batch = []
+                size = 0
+            batch.append(payload + '\n')
+            size += len(payload) + 1
+        if batch:
+            yield ''.join(batch)
+
+    def send(self, payloads, combined_events=False):
+        """
+        Write lines to graphite over a pooled connection, lines are always
+        batched so combined_events is ignored.
+        """
+        sock = self.pool.pop() if self.pool else self._connect()
+        try:
+            for batch in self.batches(payloads):
+                sock.sendall(batch)
+                self.packets_sent += 1
+                self.bytes_sent += len(batch)
+        except Exception:
+            sock.close()
+            raise
+        if len(self.pool) < self.pool_size:
+            self.pool.append(sock)
+        else:
+            sock.close()
+
+    def close(self):
+        """Close all pooled connections"""
+        while self.pool:
+            self.pool.pop().close()
+
+
+class Backoff(object):
+    """
+    Tracks consecutive send failures. After threshold failures in a row
+    sends are suspended for an exponentially growing delay (initial,
+    doubling up to max_delay seconds), callers check allowed() and count
+    the lines (or the events, before they're formatted as lines) they drop
+    instead of attempting the send.
+    """
+
+    def __init__(self, threshold=3, initial=1.0, max_delay=60.0):
+        self.threshold = threshold
+        self.initial = initial
+        self.max_delay = max_delay
+        self.until = 0
+        self.failures = 0
+        self.errors = 0
+        self.dropped = 0
+        self.dropped_events = 0
+
+    def allowed(self, now):
+        """:returns: False while backing off"""
+        return now >= self.until
+
+    def failure(self, now):
+        """Record a failed send, backing off if there were too many"""
+        self.failures += 1
+        self.errors += 1
+        if self.failures >= self.threshold:
+            self.until = now + min(
+                self.initial * 2 ** min(self.failures - self.threshold, 30),
+                self.max_delay)
+
+    def success(self):
+        """
+        Record a successful send.
+
+        :returns: tuple of (errors, dropped lines, dropped events) since
+                  the last successful send
+        """
+        counts = (self.errors, self.dropped, self.dropped_events)
+        self.failures = self.errors = self.dropped = 0
+        self.dropped_events = 0
+        self.until = 0
+        return counts
@@ -0,0 +1,173 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fcntl
+import marshal
+import mmap
+import os
+import struct
+from zlib import crc32
+
+#: magic, layout version, length and crc32 of the marshaled state
+HEADER = struct.Struct('!4sHII')
+VERSION = 1
+
+
+class SharedRegion(object):
+    """
+    State shared by all the proxy workers on a host, marshaled into an
+    mmap'ed file that is locked with flock while it's read or written.
+
+    A region that can't be read (e.g. a worker was killed half way
+    through writing it, or it was left behind by a version with another
+    layout) is discarded.
+    """
+
+    #: identifies what kind of state the region holds
+    magic = 'INFA'
+
+    def __init__(self, path, size=1048576, logger=None):
+        self.path = path
+        self.size = size
+        self.logger = logger
+        self.map = None
+        self.fd = None
+
+    def _open(self):
+        """Open (and if needed create) the shared region"""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0600)
+        try:
+            if os.fstat(fd).st_size < self.size:
+                os.ftruncate(fd, self.size)
+            self.map = mmap.mmap(fd, self.size)
+        except Exception:
+            os.close(fd)
+            raise
+        self.fd = fd
+
+    def _lock(self):
+        if self.map is None:
+            self._open()
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def _unlock(self):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _empty(self):
+        """:returns: the state of an empty region"""
+        return {}
+
+    def _read(self):
+        """
+        Read the state in the shared region, caller must hold the lock.
+        The region is reset if it can't be read.
+        """
+        magic, version, length, checksum = HEADER.unpack_from(self.map, 0)
+        if magic != self.magic or version != VERSION or not length:
+            return self._empty()
+        blob = self.map[HEADER.size:HEADER.size + length]
+        try:
+            if len(blob) != length or crc32(blob) & 0xffffffff != checksum:
+                raise ValueError('checksum mismatch')
+            return marshal.loads(blob)
+        except (ValueError, EOFError, TypeError) as err:
+            if self.logger:
+                self.logger.error('Discarding unreadable shared region '
+                                  '%s: %s' % (self.path, err))
+            self._write(None)
+            return self._empty()
+
+    def _write(self, state):
+        """
+        Write state to the shared region, caller must hold the lock
+
+        :returns: False if it doesn't fit
+        """
+        if state is None:
+            self.map[:HEADER.size] = HEADER.pack(self.magic, VERSION, 0, 0)
+            return True
+        blob = marshal.dumps(state)
+        if HEADER.size + len(blob) > self.size:
+            return False
+        self.map[HEADER.size:HEADER.size + len(blob)] = blob
+        self.map[:HEADER.size] = HEADER.pack(self.magic, VERSION, len(blob),
+                                             crc32(blob) & 0xffffffff)
+        return True
+
+
+class SharedAggregator(SharedRegion):
+    """
+    Merges the aggregated stats of all the proxy workers on a host in a
+    SharedRegion, so that a single elected worker can send them to statsd.
+
+    Each worker publishes what it aggregated once per flush interval by
+    merging it into the shared region while holding an flock on the file.
+    Whichever worker holds the (non blocking) flock on path.leader is the
+    flusher, it collects and resets the shared region every interval. If
+    the flusher dies its lock is released and another worker takes over
+    on its next flush.
+    """
+
+    def __init__(self, aggregator, path, size=1048576, logger=None):
+        super(SharedAggregator, self).__init__(path, size, logger)
+        self.aggregator = aggregator
+        self.leader_fd = None
+        self.leader = False
+
+    def _open(self):
+        super(SharedAggregator, self)._open()
+        self.leader_fd = os.open(self.path + '.leader',
+                                 os.O_RDWR | os.O_CREAT, 0600)
+
+    def _elect(self):
+        """Try to become the flusher, if nobody else is"""
+        if not self.leader:
+            try:
+                fcntl.flock(self.leader_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self.leader = True
+            except IOError:
+                pass
+        return self.leader
+
+    def _empty(self):
+        return {'counters': {}, 'timers': {}}
+
+    def flush(self):
+        """
+        Publish this worker's aggregated stats and, if we're the elected
+        flusher, collect everyone's.
+
+        :returns: list of statsd lines to send, stats that don't fit in the
+                  shared region are returned to be sent by this worker
+        """
+        lines = []
+        collected = None
+        self._lock()
+        try:
+            # only take our stats once the lock is held and the region
+            # was read, they stay in the aggregator for the next flush
+            # if either fails
+            shared = self._read()
+            state = self.aggregator.take()
+            shared = self.aggregator.merge(shared, state)
+            if not self._write(shared):
+                lines.extend(self.aggregator.format(state))
+                shared = None
+            if self._elect():
+                collected = shared if shared is not None else self._read()
+                self._write(None)
+        finally:
+            self._unlock()
+        if collected is not None:
+            lines.extend(self.aggregator.format(collected))
+        return lines
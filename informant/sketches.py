@@ -0,0 +1,139 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from heapq import heappush, heapreplace
+from math import log
+
+
+class SpaceSaving(object):
+    """
+    Space-Saving heavy hitter sketch tracking at most capacity keys. Each
+    tracked key keeps a weighted request count (which may overestimate
+    the true count by at most the error it inherited when it replaced the
+    least frequent key), and the bytes and errors seen since it was
+    tracked.
+
+    The least frequent key is found with a min-heap of (count, key) that
+    isn't updated when a tracked key's count goes up, the counts in it are
+    lower bounds that are only refreshed when they reach the top. Updates
+    of tracked keys are O(1) and replacing a key is amortized O(log
+    capacity).
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        # key -> [count, error, bytes, errors]
+        self.counters = {}
+        # (count, key) with count <= the key's current count
+        self.heap = []
+
+    def update(self, key, weight=1, nbytes=0, error=False):
+        """Record a (weighted) request for key"""
+        counter = self.counters.get(key)
+        if counter is None:
+            if len(self.counters) < self.capacity:
+                counter = self.counters[key] = [0, 0, 0, 0]
+                heappush(self.heap, (0, key))
+            else:
+                counter = self.counters[key] = self._replace_min(key)
+        counter[0] += weight
+        counter[2] += nbytes
+        if error:
+            counter[3] += weight
+
+    def _replace_min(self, key):
+        """
+        Stop tracking the least frequent key in favour of key
+
+        :returns: the counter for key, inheriting the evicted count
+        """
+        heap = self.heap
+        counters = self.counters
+        while True:
+            count, victim = heap[0]
+            current = counters[victim][0]
+            if current == count:
+                break
+            # stale, put it back with its current count
+            heapreplace(heap, (current, victim))
+        del counters[victim]
+        heapreplace(heap, (count, key))
+        return [count, count, 0, 0]
+
+    def top(self, k):
+        """
+        Rank keys by their guaranteed count, the count minus the error
+        inherited from the key they replaced, so a key that was only just
+        tracked isn't reported with the evicted key's requests.
+
+        :returns: list of (key, guaranteed count, bytes, errors) for the k
+                  most frequent keys, most frequent first
+        """
+        ranked = sorted(((key, count - error, nbytes, errors)
+                         for key, (count, error, nbytes, errors) in
+                         self.counters.iteritems()),
+                        key=lambda item: item[1], reverse=True)
+        return ranked[:k]
+
+    def clear(self):
+        self.counters = {}
+        self.heap = []
+
+
+class HyperLogLog(object):
+    """
+    HyperLogLog distinct count estimator using 2 ** precision one byte
+    registers (4KB at the default precision of 12, ~1.6% standard error).
+    It uses 32 bit hashes, which is plenty for the number of distinct
+    values seen in a flush interval.
+    """
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.size = 1 << precision
+        self.shift = 32 - precision
+        self.mask = (1 << self.shift) - 1
+        if self.size >= 128:
+            self.alpha = 0.7213 / (1 + 1.079 / self.size)
+        else:
+            self.alpha = {16: 0.673, 32: 0.697, 64: 0.709}[self.size]
+        self.registers = bytearray(self.size)
+
+    def add(self, value):
+        """Add a string value to the set"""
+        # python's builtin string hash folded to 32 bits and run through
+        # an integer finalizer whose intermediate values all fit in a
+        # native int, this is called on every request so keep it cheap
+        h = hash(value)
+        h = (h ^ (h >> 32)) & 0xffffffff
+        h = ((h >> 16) ^ h) * 0x45d9f3b & 0xffffffff
+        h = ((h >> 16) ^ h) * 0x45d9f3b & 0xffffffff
+        h ^= h >> 16
+        index = h >> self.shift
+        rank = self.shift - (h & self.mask).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def cardinality(self):
+        """:returns: the estimated number of distinct values added"""
+        estimate = self.alpha * self.size * self.size / \
+            sum(2.0 ** -r for r in self.registers)
+        if estimate <= 2.5 * self.size:
+            zeros = self.registers.count(b"\0")
+            if zeros:
+                # small range correction (linear counting)
+                estimate = self.size * log(float(self.size) / zeros)
+        return int(round(estimate))
+
+    def clear(self):
+        self.registers = bytearray(self.size)
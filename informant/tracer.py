@@ -0,0 +1,58 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+from collections import namedtuple
+
+#: A request that took longer than the slow request threshold, times are in
+#: ms and timestamp is when it was recorded
+SlowRequest = namedtuple('SlowRequest', [
+    'timestamp', 'trans_id', 'method', 'stat_type', 'acct', 'status',
+    'start_response_time', 'duration', 'transferred'])
+
+
+class SlowRequestTracer(object):
+    """
+    Keeps the last size slow requests in a preallocated ring buffer, older
+    entries are overwritten so memory use is fixed.
+    """
+
+    def __init__(self, size=100):
+        self.size = size
+        self.entries = [None] * size
+        self.position = 0
+        self.recorded = 0
+
+    def record(self, entry):
+        """Add a SlowRequest, overwriting the oldest one if full"""
+        self.entries[self.position] = entry
+        self.position = (self.position + 1) % self.size
+        self.recorded += 1
+
+    def requests(self):
+        """:returns: list of the buffered SlowRequests, oldest first"""
+        return [entry for entry in
+                self.entries[self.position:] + self.entries[:self.position]
+                if entry is not None]
+
+    def dump(self):
+        """:returns: the buffered requests as a JSON list of objects"""
+        return json.dumps([entry._asdict() for entry in self.requests()])
+
+    def dump_to_file(self, path):
+        """Atomically replace the file at path with dump()"""
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w') as fp:
+            fp.write(self.dump())
+        os.rename(tmp_path, path)
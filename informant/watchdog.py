@@ -0,0 +1,78 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from time import time
+
+from eventlet import sleep
+from eventlet.hubs import get_hub
+
+from informant.histogram import Histogram
+
+#: the watchdog that should run in each process, a watchdog greenthread
+#: inherited over a fork (e.g. from the app loaded by the parent before
+#: the workers were forked) stops when it finds it was replaced
+_watchdogs = {}
+
+
+class HubWatchdog(object):
+    """
+    Measures how late the eventlet hub wakes up a greenthread sleeping for
+    interval seconds. The extra delay is time the hub spent running other
+    greenthreads without yielding, lags are recorded in microseconds.
+    """
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.lags = Histogram()
+
+    def register(self):
+        """Make this the watchdog for the current process"""
+        _watchdogs[os.getpid()] = self
+
+    def running(self):
+        return _watchdogs.get(os.getpid()) is self
+
+    def tick(self):
+        """Sleep for interval and record how late we woke up"""
+        start = time()
+        sleep(self.interval)
+        lag = time() - start - self.interval
+        self.lags.record(lag * 1000000 if lag > 0 else 0)
+
+    def run(self, on_start=None):
+        """Record lags for as long as we're this process' watchdog"""
+        if on_start is not None and self.running():
+            on_start()
+        while self.running():
+            self.tick()
+
+    def take(self):
+        """:returns: the lag Histogram for the interval, resetting it"""
+        lags, self.lags = self.lags, Histogram()
+        return lags
+
+
+def hub_waiting():
+    """
+    :returns: tuple of the number of greenthreads waiting on a timer (e.g.
+              sleeping) and on a file descriptor (e.g. socket reads), as
+              far as the hub knows
+    """
+    hub = get_hub()
+    timers = len(getattr(hub, 'timers', ())) + \
+        len(getattr(hub, 'next_timers', ())) - \
+        getattr(hub, 'timers_canceled', 0)
+    listeners = getattr(hub, 'listeners', {})
+    fds = sum(len(bucket) for bucket in listeners.itervalues())
+    return max(timers, 0), fds
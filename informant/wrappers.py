@@ -0,0 +1,131 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from time import time
+
+
+class ResponseTimer(object):
+    """
+    Wraps a response app_iter recording when the first chunk was produced,
+    when the body was finished and how many bytes were yielded. Chunks are
+    passed through untouched.
+    """
+
+    def __init__(self, app_iter):
+        self.app_iter = app_iter
+        self._next = iter(app_iter).next
+        self.first_byte_time = None
+        self.last_byte_time = None
+        self.bytes_sent = 0
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        try:
+            chunk = self._next()
+        except StopIteration:
+            self.last_byte_time = time()
+            raise
+        if self.first_byte_time is None and chunk:
+            self.first_byte_time = time()
+        self.bytes_sent += len(chunk)
+        return chunk
+
+    def close(self):
+        if self.last_byte_time is None:
+            # the client went away (or the server gave up) mid body
+            self.last_byte_time = time()
+        close = getattr(self.app_iter, 'close', None)
+        if close:
+            close()
+
+
+class InputTimer(object):
+    """
+    Wraps wsgi.input counting the bytes read, the number of read calls and
+    the time spent blocked reading from the client. Data is passed through
+    untouched.
+    """
+
+    def __init__(self, wsgi_input):
+        self.wsgi_input = wsgi_input
+        self.bytes_read = 0
+        self.reads = 0
+        self.read_time = 0.0
+        self.first_read_time = None
+        self.last_read_time = None
+
+    def _timed(self, func, *args):
+        start = time()
+        data = func(*args)
+        end = time()
+        if self.first_read_time is None:
+            self.first_read_time = start
+        self.last_read_time = end
+        self.read_time += end - start
+        self.reads += 1
+        return data
+
+    def read(self, *args):
+        data = self._timed(self.wsgi_input.read, *args)
+        self.bytes_read += len(data)
+        return data
+
+    def readline(self, *args):
+        data = self._timed(self.wsgi_input.readline, *args)
+        self.bytes_read += len(data)
+        return data
+
+    def readlines(self, *args):
+        lines = self._timed(self.wsgi_input.readlines, *args)
+        self.bytes_read += sum(len(line) for line in lines)
+        return lines
+
+    def __iter__(self):
+        return iter(self.readline, '')
+
+    def __getattr__(self, name):
+        return getattr(self.wsgi_input, name)
+
+
+class SubrequestTimer(ResponseTimer):
+    """
+    ResponseTimer for a subrequest that adds its duration and bytes to
+    its client request's FanOut context once the body is finished or
+    closed.
+    """
+
+    def __init__(self, app_iter, context, source, start_time):
+        ResponseTimer.__init__(self, app_iter)
+        self.context = context
+        self.source = source
+        self.start_time = start_time
+
+    def next(self):
+        try:
+            return ResponseTimer.next(self)
+        except StopIteration:
+            self._report()
+            raise
+
+    def close(self):
+        ResponseTimer.close(self)
+        self._report()
+
+    def _report(self):
+        if self.context is not None:
+            self.context.add(self.source,
+                             (self.last_byte_time - self.start_time) * 1000,
+                             self.bytes_sent)
+            self.context = None
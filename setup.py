@@ -25,6 +25,11 @@ setup(
     entry_points={
         'paste.filter_factory': [
             'informant=informant.middleware:filter_factory',
+            'fanout_registrar=informant.fanout:registrar_filter_factory',
+            'fanout_collector=informant.fanout:collector_filter_factory',
+            ],
+        'console_scripts': [
+            'informant-backfill=informant.backfill:main',
             ],
         },
     )
@@ -0,0 +1,49 @@
+import unittest
+
+from informant.aggregator import Aggregator
+
+
+class TestAggregator(unittest.TestCase):
+
+    def test_counters_summed(self):
+        agg = Aggregator()
+        agg.incr('obj.GET.200')
+        agg.incr('obj.GET.200')
+        agg.incr('tfer.obj.GET.200', 500)
+        agg.incr('tfer.obj.GET.200', 250)
+        lines = sorted(agg.flush())
+        self.assertEquals(lines, ['obj.GET.200:2|c',
+                                  'tfer.obj.GET.200:750|c'])
+        self.assertEquals(agg.flush(), [])
+
+    def test_counters_scaled_by_sample_rate(self):
+        agg = Aggregator()
+        agg.add([('obj.GET.200', 1, 'c'), ('obj.GET.200', 10, 'ms')], 0.5)
+        agg.add([('obj.GET.200', 1, 'c'), ('obj.GET.200', 20, 'ms')], 0.25)
+        lines = sorted(agg.flush())
+        self.assertEquals(lines[0], 'obj.GET.200.count:2|g')
+        self.assertEquals(lines[-1], 'obj.GET.200:6|c')
+
+    def test_timers_summarized(self):
+        agg = Aggregator()
+        agg.add([('obj.GET.200', 10, 'ms'), ('obj.GET.200', 30, 'ms'),
+                 ('obj.GET.200', 20, 'ms')])
+        lines = sorted(agg.flush())
+        self.assertEquals(lines, ['obj.GET.200.count:3|g',
+                                  'obj.GET.200.lower:10|g',
+                                  'obj.GET.200.mean:20|g',
+                                  'obj.GET.200.upper:30|g'])
+
+    def test_timer_histograms(self):
+        agg = Aggregator(histograms=True, percentiles=(99, 50))
+        for value in xrange(1, 101):
+            agg.timing('obj.GET.200', value)
+        lines = sorted(agg.flush())
+        self.assertEquals(lines, ['obj.GET.200.count:100|g',
+                                  'obj.GET.200.max:100|g',
+                                  'obj.GET.200.p50:50|g',
+                                  'obj.GET.200.p99:99|g'])
+
+
+if __name__ == '__main__':
+    unittest.main()
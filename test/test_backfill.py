@@ -0,0 +1,143 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from informant import backfill
+
+LINE = ('Mar  7 05:35:00 proxy1 proxy-server: 10.0.0.1 10.0.0.1 '
+        '07/Mar/2012/05/35/00 %s %s HTTP/1.0 %d - curl - %s %s - '
+        'tx0123 - %s %s - %s %s 0')
+
+
+def log_line(method='GET', path='/v1/AUTH_test/cont/obj', status=200,
+             recvd='-', sent='500', request_time='0.0100', source='-',
+             start_time='1331098500.000', end_time='1331098500.010'):
+    return LINE % (method, path, status, recvd, sent, request_time, source,
+                   start_time, end_time)
+
+
+OPTIONS = {'bucket': 10, 'lag': 0, 'valid_methods': ['GET', 'PUT'],
+           'prepend': '', 'prefix_accounts': set(['AUTH_test']),
+           'prefix_accounts_prepend': '', 'histograms': False,
+           'percentiles': [50, 90, 99]}
+
+
+class TestBackfill(unittest.TestCase):
+
+    def test_parse_line(self):
+        start_time, record = backfill.parse_line(log_line())
+        self.assertEquals(start_time, 1331098500.0)
+        self.assertEquals((record.stat_type, record.method, record.status,
+                           record.duration, record.start_response_time,
+                           record.transferred, record.acct, record.rate),
+                          ('obj', 'GET', 200, 10.0, None, 500, 'AUTH_test',
+                           1.0))
+
+    def test_parse_line_fields(self):
+        start_time, record = backfill.parse_line(log_line(
+            method='PUT', path='/v1/AUTH_test/c%20d?multipart-manifest=put',
+            status=201, recvd='1024', sent='-', source='SLO'))
+        self.assertEquals((record.stat_type, record.method, record.status,
+                           record.transferred, record.acct),
+                          ('SLO', 'PUT', 201, 1024, None))
+        start_time, record = backfill.parse_line(log_line(method='PATCH'))
+        self.assertEquals(record.method, 'BAD_METHOD')
+
+    def test_parse_line_without_start_time(self):
+        line = log_line().rsplit(' ', 3)[0]
+        start_time, record = backfill.parse_line(line)
+        self.assertEquals(start_time, 1331098500 - 0.01)
+
+    def test_parse_line_invalid(self):
+        self.assertEquals(backfill.parse_line('garbage'), None)
+        self.assertEquals(backfill.parse_line(
+            log_line().replace(' 200 ', ' abc ')), None)
+
+    def test_parse_lines(self):
+        buckets, invalid, latest = backfill.parse_lines(
+            [log_line(), log_line(start_time='1331098505.0'),
+             log_line(start_time='1331098512.0'), 'garbage'], OPTIONS)
+        self.assertEquals(invalid, 1)
+        self.assertEquals(latest, 1331098512.0)
+        self.assertEquals(sorted(buckets), [1331098500, 1331098510])
+        requests, state = buckets[1331098500]
+        self.assertEquals(requests, 2)
+        self.assertEquals(state['counters']['obj.GET.200'], 2)
+        self.assertEquals(state['counters']['tfer.obj.GET.200'], 1000)
+        self.assertEquals(state['counters']['AUTH_test.obj.GET.200'], 2)
+        self.assertEquals(state['timers']['obj.GET.200'][:2], [2, 20.0])
+        self.assertFalse('srt.obj.GET.200' in state['timers'])
+
+    def test_late_buckets_dropped(self):
+        written = []
+        bf = backfill.Backfill(OPTIONS, written.extend)
+        bf.add(backfill.parse_lines([log_line(start_time='1331098525.0')],
+                                    OPTIONS))
+        self.assertEquals(written, [])
+        bf.add(backfill.parse_lines([log_line(start_time='1331098545.0'),
+                                     log_line(start_time='1331098501.0')],
+                                    OPTIONS))
+        self.assertTrue('obj.GET.200 1 1331098520' in written, written)
+        bf.add(backfill.parse_lines([log_line(start_time='1331098521.0')],
+                                    OPTIONS))
+        bf.flush()
+        self.assertEquals(bf.late, 1)
+        self.assertEquals(bf.requests, 3)
+        self.assertTrue('obj.GET.200 1 1331098500' in written, written)
+        self.assertTrue('obj.GET.200 1 1331098540' in written, written)
+
+    def test_run(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            paths = [os.path.join(tmpdir, 'proxy.log'),
+                     os.path.join(tmpdir, 'proxy.log.1.gz')]
+            with open(paths[0], 'w') as fp:
+                for i in xrange(10):
+                    fp.write(log_line() + '\n')
+            fp = gzip.open(paths[1], 'wb')
+            for i in xrange(5):
+                fp.write(log_line(status=404) + '\n')
+            fp.close()
+            for workers in (1, 2):
+                written = []
+                result = backfill.run(paths, OPTIONS, written.extend,
+                                      workers, chunk_size=3)
+                self.assertEquals(result.requests, 15)
+                self.assertTrue('obj.GET.200 10 1331098500' in written,
+                                written)
+                self.assertTrue('obj.GET.404 5 1331098500' in written,
+                                written)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_run_newest_first(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            paths = [os.path.join(tmpdir, 'proxy.log'),
+                     os.path.join(tmpdir, 'proxy.log.1'),
+                     os.path.join(tmpdir, 'empty.log')]
+            for path, start_time in zip(paths[:2], (1331184900, 1331098500)):
+                with open(path, 'w') as fp:
+                    fp.write('garbage\n')
+                    for i in xrange(10):
+                        fp.write(log_line(start_time='%d.0' % (
+                            start_time + i)) + '\n')
+            open(paths[2], 'w').close()
+            self.assertEquals(backfill.first_timestamp(paths[0]),
+                              1331184900.0)
+            self.assertEquals(backfill.first_timestamp(paths[2]), None)
+            self.assertEquals(backfill.sort_paths(['-'] + paths),
+                              [paths[1], paths[0], '-', paths[2]])
+            written = []
+            result = backfill.run(paths, OPTIONS, written.extend)
+            self.assertEquals((result.requests, result.late), (20, 0))
+            self.assertTrue('obj.GET.200 10 1331098500' in written, written)
+            self.assertTrue('obj.GET.200 10 1331184900' in written, written)
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
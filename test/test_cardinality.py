@@ -0,0 +1,40 @@
+import unittest
+
+from informant.cardinality import CardinalityGuard, OTHER
+from informant.metrics import EventRecord
+
+
+class TestCardinalityGuard(unittest.TestCase):
+
+    def test_fold(self):
+        guard = CardinalityGuard({'status': 2})
+        self.assertEquals([guard.fold('status', s)
+                           for s in (200, 404, 200, 418, 999, 404)],
+                          [200, 404, 200, OTHER, OTHER, 404])
+        # dimensions without a limit aren't capped
+        self.assertEquals(guard.fold('type', 'anything'), 'anything')
+        self.assertEquals(guard.take(), {'status': 2})
+        # a new interval starts from scratch
+        self.assertEquals(guard.fold('status', 418), 418)
+        self.assertEquals(guard.take(), {'status': 0})
+
+    def test_fold_record(self):
+        guard = CardinalityGuard({'type': 1, 'status': 1, 'source': 1})
+        record = EventRecord('obj', 'GET', 200, 10, 5, 500, None,
+                             subrequests=(('SLO', 2, 20, 100),))
+        self.assertTrue(guard.fold_record(record) is record)
+        record = EventRecord('FOO', 'GET', 201, 10, 5, 500, None,
+                             subrequests=(('DLO', 1, 10, 50),
+                                          ('SLO', 2, 20, 100),
+                                          ('BAR', 3, 30, 150)))
+        folded = guard.fold_record(record)
+        self.assertEquals(folded.stat_type, OTHER)
+        self.assertEquals(folded.status, OTHER)
+        self.assertEquals(folded.subrequests, (('SLO', 2, 20, 100),
+                                               (OTHER, 4, 40, 200)))
+        self.assertEquals(guard.take(),
+                          {'type': 1, 'status': 1, 'source': 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
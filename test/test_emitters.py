@@ -0,0 +1,83 @@
+import unittest
+
+from informant.aggregator import Aggregator
+from informant.emitters import Metric, StatsdEmitter, DogStatsdEmitter, \
+    GraphiteEmitter
+
+TAGS = (('type', 'obj'), ('method', 'GET'), ('status', 200))
+
+
+class TestStatsdEmitter(unittest.TestCase):
+
+    def test_lines(self):
+        emitter = StatsdEmitter()
+        series = emitter.series(Metric('srt.obj.GET.200', 'srt', TAGS))
+        self.assertEquals(series, 'srt.obj.GET.200')
+        self.assertEquals(emitter.template(series, 'ms', 0.5) % 12,
+                          'srt.obj.GET.200:12|ms|@0.5')
+        self.assertEquals(emitter.counter(series, 3, 1331098500),
+                          'srt.obj.GET.200:3|c')
+        self.assertEquals(emitter.gauge(series, '.p99', 7, 1331098500),
+                          'srt.obj.GET.200.p99:7|g')
+
+
+class TestDogStatsdEmitter(unittest.TestCase):
+
+    def test_lines(self):
+        emitter = DogStatsdEmitter()
+        series = emitter.series(Metric('srt.obj.GET.200', 'srt', TAGS))
+        self.assertEquals(series, ('srt', 'type:obj,method:GET,status:200'))
+        self.assertEquals(emitter.template(series, 'ms', 0.5) % 12,
+                          'srt:12|ms|@0.5|#type:obj,method:GET,status:200')
+        self.assertEquals(emitter.counter(series, 3, 1331098500),
+                          'srt:3|c|#type:obj,method:GET,status:200')
+        self.assertEquals(emitter.gauge(series, '.p99', 7, 1331098500),
+                          'srt.p99:7|g|#type:obj,method:GET,status:200')
+
+    def test_tag_values_sanitized(self):
+        emitter = DogStatsdEmitter()
+        series = emitter.series(Metric('x', 'requests',
+                                       (('account', 'AUTH_a,b|c%d'),)))
+        self.assertEquals(emitter.template(series, 'c', 1) % 1,
+                          'requests:1|c|@1|#account:AUTH_a_b_c%d')
+
+    def test_plain_series(self):
+        emitter = DogStatsdEmitter()
+        self.assertEquals(emitter.gauge(emitter.plain_series(
+            'distinct.accounts'), '', 5, 1331098500),
+            'distinct.accounts:5|g')
+
+    def test_aggregated(self):
+        emitter = DogStatsdEmitter()
+        agg = Aggregator(emitter=emitter)
+        series = emitter.series(Metric('obj.GET.200', 'requests', TAGS))
+        agg.add([(series, 1, 'c'), (series, 1, 'c')])
+        self.assertEquals(agg.flush(),
+                          ['requests:2|c|#type:obj,method:GET,status:200'])
+
+
+class TestGraphiteEmitter(unittest.TestCase):
+
+    def test_lines(self):
+        emitter = GraphiteEmitter()
+        self.assertTrue(emitter.aggregate_only)
+        series = emitter.series(Metric('obj.GET.200', 'requests', TAGS))
+        self.assertEquals(emitter.template(series, 'c', 1), None)
+        self.assertEquals(emitter.counter(series, 3, 1331098500.5),
+                          'obj.GET.200 3 1331098500')
+        self.assertEquals(emitter.gauge(series, '.mean', 7, 1331098500),
+                          'obj.GET.200.mean 7 1331098500')
+
+    def test_aggregated(self):
+        agg = Aggregator(emitter=GraphiteEmitter())
+        agg.add([('obj.GET.200', 1, 'c'), ('obj.GET.200', 10, 'ms')])
+        lines = sorted(agg.format(agg.take(), 1331098500))
+        self.assertEquals(lines, ['obj.GET.200 1 1331098500',
+                                  'obj.GET.200.count 1 1331098500',
+                                  'obj.GET.200.lower 10 1331098500',
+                                  'obj.GET.200.mean 10 1331098500',
+                                  'obj.GET.200.upper 10 1331098500'])
+
+
+if __name__ == '__main__':
+    unittest.main()
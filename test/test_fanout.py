@@ -0,0 +1,52 @@
+import unittest
+
+from informant import fanout
+
+
+class TestFanOut(unittest.TestCase):
+
+    def tearDown(self):
+        fanout.CONTEXTS.clear()
+
+    def test_summary(self):
+        context = fanout.FanOut()
+        self.assertEquals(context.summary(), ())
+        context.add('SLO', 10, 100)
+        context.add('SLO', 5, 50)
+        context.add('DLO', 1, 0)
+        self.assertEquals(context.summary(), (('DLO', 1, 1, 0),
+                                              ('SLO', 2, 15, 150)))
+
+    def test_register(self):
+        context = fanout.FanOut()
+        fanout.register(context, 'tx1')
+        self.assertTrue(fanout.lookup('tx1') is context)
+        # a context is only registered once
+        fanout.register(context, 'tx2')
+        self.assertEquals(fanout.lookup('tx2'), None)
+        fanout.unregister(context)
+        self.assertEquals(fanout.lookup('tx1'), None)
+        fanout.unregister(fanout.FanOut())
+
+    def test_filter_factories(self):
+        app = object()
+        registrar = fanout.registrar_filter_factory({})(app)
+        self.assertTrue(isinstance(registrar, fanout.FanOutRegistrar))
+        self.assertTrue(registrar.app is app)
+        collector = fanout.collector_filter_factory({})(app)
+        self.assertTrue(isinstance(collector, fanout.FanOutCollector))
+        self.assertTrue(collector.app is app)
+
+    def test_registry_bounded(self):
+        orig_max = fanout.MAX_CONTEXTS
+        fanout.MAX_CONTEXTS = 2
+        try:
+            for i in xrange(3):
+                fanout.register(fanout.FanOut(), 'tx%d' % i)
+        finally:
+            fanout.MAX_CONTEXTS = orig_max
+        self.assertEquals(list(fanout.CONTEXTS), ['tx1', 'tx2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+from informant import histogram
+from informant.histogram import Histogram
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_bucket_bounds(self):
+        for value in (0, 1, 31, 32, 33, 63, 64, 65, 1000, 123456,
+                      histogram.MAX_VALUE):
+            index = histogram.bucket_index(value)
+            self.assertTrue(index < histogram.BUCKETS)
+            upper = histogram.bucket_upper(index)
+            self.assertTrue(upper >= value, (value, upper))
+            # relative error stays within one sub bucket
+            self.assertTrue(upper - value <= value / 32, (value, upper))
+            self.assertEquals(histogram.bucket_index(upper), index)
+            self.assertEquals(histogram.bucket_index(upper + 1), index + 1)
+
+    def test_percentiles(self):
+        hist = Histogram()
+        for value in xrange(1, 1001):
+            hist.record(value)
+        self.assertEquals(hist.count, 1000)
+        self.assertEquals(hist.max, 1000)
+        p50, p90, p99, p100 = hist.percentiles([50, 90, 99, 100])
+        self.assertTrue(500 <= p50 <= 515, p50)
+        self.assertTrue(900 <= p90 <= 928, p90)
+        self.assertTrue(990 <= p99 <= 1000, p99)
+        self.assertEquals(p100, 1000)
+
+    def test_empty_and_clamped(self):
+        hist = Histogram()
+        self.assertEquals(hist.percentiles([50, 99]), [0, 0])
+        hist.record(-5)
+        hist.record(histogram.MAX_VALUE * 2)
+        self.assertEquals(hist.percentiles([50, 100]),
+                          [0, histogram.MAX_VALUE])
+
+
+if __name__ == '__main__':
+    unittest.main()
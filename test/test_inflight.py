@@ -0,0 +1,63 @@
+import unittest
+
+from informant.inflight import InFlight, InFlightRequest
+
+
+class FakeAppIter(object):
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+class TestInFlight(unittest.TestCase):
+
+    def test_current_and_peak(self):
+        inflight = InFlight()
+        for i in xrange(3):
+            inflight.start(('obj', 'GET'))
+        inflight.start(('cont', 'GET'))
+        inflight.finish(('obj', 'GET'))
+        inflight.finish(('obj', 'GET'))
+        inflight.finish(('cont', 'GET'))
+        self.assertEquals(sorted(inflight.take()),
+                          [(('cont', 'GET'), 0, 1), (('obj', 'GET'), 1, 3)])
+        self.assertEquals((inflight.total, inflight.total_peak), (1, 1))
+        # idle classes are forgotten after an idle interval
+        self.assertEquals(inflight.take(), [(('obj', 'GET'), 1, 1)])
+        inflight.finish(('obj', 'GET'))
+        self.assertEquals(inflight.take(), [(('obj', 'GET'), 0, 1)])
+        self.assertEquals(inflight.take(), [])
+
+
+class TestInFlightRequest(unittest.TestCase):
+
+    def test_finished_once(self):
+        inflight = InFlight()
+        request = InFlightRequest(inflight, ('obj', 'GET'))
+        request.app_iter = app_iter = FakeAppIter(['abc'])
+        self.assertEquals(inflight.total, 1)
+        self.assertEquals(list(request), ['abc'])
+        request.close()
+        self.assertTrue(app_iter.closed)
+        self.assertEquals(inflight.total, 0)
+        request.finish({})
+        request.close()
+        self.assertEquals(inflight.total, 0)
+        self.assertEquals(inflight.current[('obj', 'GET')], 0)
+
+    def test_finished_without_close(self):
+        inflight = InFlight()
+        request = InFlightRequest(inflight, ('obj', 'GET'))
+        request.finish({})
+        self.assertEquals(inflight.total, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,11 @@
+import os
+import shutil
+import tempfile
 import unittest
 
 from swift.common.swob import Request, Response
 from informant import middleware
+from informant.metrics import classify_path
 
 class FakeApp(object):
 
@@ -25,6 +29,15 @@ class FakeApp(object):
 def start_response(*args):
     pass
 
+class FakeSocket(object):
+
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, payload, addr):
+        self.sent.append(payload)
+        return len(payload)
+
 class Mocked(object):
 
     def __init__(self):
@@ -370,6 +383,852 @@ class TestInformant(unittest.TestCase):
                 self.assertEquals(srt.startswith('srt.acct.BAD_METHOD.200'), True)
                 self.assertEquals(tfer.startswith('tfer.acct.BAD_METHOD.200:500'), True)   
 
+    def test_informant_aggregate_events(self):
+        app = middleware.Informant(FakeApp(), {'aggregate_events': 'yes',
+                                               'statsd_sample_rate': '1'})
+        app._send_events = self.mock.fake_send_events
+        app._send_sampled_event = self.mock.fake_send_sampled_event
+        app._start_flusher = lambda: None
+        for i in xrange(3):
+            req = Request.blank('/v1/someaccount/somecontainer/someobj',
+                                environ={'REQUEST_METHOD': 'GET'})
+            req.environ['informant.status'] = 200
+            req.environ['informant.start_time'] = 1331098000.00
+            req.environ['informant.start_response_time'] = 1331098000.01
+            req.client_disconnect = False
+            req.bytes_transferred = "500"
+            app.statsd_event(req.environ, req)
+        self.assertEquals(self.mock._send_events_calls, [])
+        app.flush_events()
+        lines = self.mock._send_events_calls[0][0][0]
+        self.assertTrue('obj.GET.200:3|c' in lines, lines)
+        self.assertTrue('tfer.obj.GET.200:1500|c' in lines, lines)
+        self.assertTrue('obj.GET.200.count:3|g' in lines, lines)
+        self.assertTrue('srt.obj.GET.200.count:3|g' in lines, lines)
+
+    def _async_app(self, **conf):
+        conf['async_events'] = 'yes'
+        app = middleware.Informant(FakeApp(), conf)
+        app._send_events = self.mock.fake_send_events
+        app._send_sampled_event = self.mock.fake_send_sampled_event
+        app._sender_running = True
+        return app
+
+    def _obj_req(self):
+        req = Request.blank('/v1/someaccount/somecontainer/someobj',
+                            environ={'REQUEST_METHOD': 'GET'})
+        req.environ['informant.status'] = 200
+        req.environ['informant.start_time'] = 1331098000.00
+        req.environ['informant.start_response_time'] = 1331098000.01
+        req.client_disconnect = False
+        req.bytes_transferred = "500"
+        return req
+
+    def test_informant_async_events_queued(self):
+        app = self._async_app()
+        req = self._obj_req()
+        app.statsd_event(req.environ, req)
+        self.assertEquals(self.mock._send_events_calls, [])
+        self.assertEquals(app.event_queue.qsize(), 1)
+        record = app.event_queue.get_nowait()
+        self.assertEquals((record.stat_type, record.method, record.status,
+                           record.transferred), ('obj', 'GET', 200, 500))
+        app._emit_records([record])
+        counter = self.mock._send_events_calls[0][0][0][0]
+        self.assertEquals(counter, 'obj.GET.200:1|c|@0.5')
+
+    def test_informant_async_events_dropped(self):
+        app = self._async_app(queue_size='2')
+        for i in xrange(5):
+            req = self._obj_req()
+            app.statsd_event(req.environ, req)
+        self.assertEquals(app.event_queue.qsize(), 2)
+        self.assertEquals(app.dropped_events, 3)
+
+    def test_classify_path(self):
+        for path, expected in [
+                ('/healthcheck', ('healthcheck', None)),
+                ('/', ('invalid', None)),
+                ('/v1/', ('invalid', None)),
+                ('/v1', ('invalid', None)),
+                ('/something', ('invalid', None)),
+                ('/v1/a', ('acct', 'a')),
+                ('/v1/a/', ('acct', 'a')),
+                ('/v1.0/a', ('acct', 'a')),
+                ('/v1/a/c', ('cont', 'a')),
+                ('/v1/a/c/', ('cont', 'a')),
+                ('/v1/a/c/o', ('obj', 'a')),
+                ('/v1/a/c/o/with/extras', ('obj', 'a')),
+                ('/v1//c', ('cont', None))]:
+            self.assertEquals(classify_path(path), expected,
+                              path)
+
+    def test_informant_call_sampled(self):
+        app = middleware.Informant(FakeApp(iter([('200 OK', {}, 'hi')])),
+                                   {'statsd_sample_rate': '1'})
+        req = Request.blank('/v1/a/c/o')
+        req.environ['eventlet.posthooks'] = []
+        app(req.environ, start_response)
+        self.assertEquals(len(req.environ['eventlet.posthooks']), 1)
+        hook, args, kwargs = req.environ['eventlet.posthooks'][0]
+        self.assertEquals(hook, app.statsd_event)
+        self.assertTrue(isinstance(args[0], Request))
+        self.assertEquals(req.environ['informant.status'], 200)
+
+    def test_informant_call_unsampled(self):
+        app = middleware.Informant(FakeApp(iter([('200 OK', {}, 'hi')])),
+                                   {'statsd_sample_rate': '0'})
+        req = Request.blank('/v1/a/c/o')
+        req.environ['eventlet.posthooks'] = []
+        app(req.environ, start_response)
+        self.assertEquals(req.environ['eventlet.posthooks'], [])
+        self.assertTrue('informant.start_time' not in req.environ)
+
+    def test_informant_templates_cached(self):
+        record = middleware.EventRecord('obj', 'GET', 200, 10, 5, 500,
+                                        'AUTH_omgtests', rate=0.5)
+        self.assertEquals(self.app._record_lines(record), [
+            'obj.GET.200:1|c|@0.5', 'obj.GET.200:10|ms|@0.5',
+            'srt.obj.GET.200:5|ms|@0.5', 'tfer.obj.GET.200:500|c|@0.5',
+            'AUTH_omgtests.obj.GET.200:1|c|@0.5',
+            'AUTH_omgtests.obj:10|ms|@0.5',
+            'AUTH_omgtests.srt.obj.GET.200:5|ms|@0.5'])
+        templates = self.app._stat_templates(record)
+        self.assertTrue(self.app._stat_templates(
+            record._replace(duration=20)) is templates)
+        self.assertEquals(len(self.app.templates), 1)
+
+    def test_informant_templates_bounded(self):
+        app = middleware.Informant(FakeApp(), {'template_cache_size': '3'})
+        for status in xrange(200, 210):
+            record = middleware.EventRecord('obj', 'GET', status, 10, 5,
+                                            500, None, rate=0.5)
+            app._record_lines(record)
+        self.assertEquals(len(app.templates), 3)
+        self.assertEquals([k[2] for k in app.templates], [207, 208, 209])
+
+    def test_informant_templates_escaped(self):
+        record = middleware.EventRecord('100%', 'GET', 200, 10, 5, 500,
+                                        None, rate=0.5)
+        self.assertEquals(self.app._record_lines(record)[0],
+                          '100%.GET.200:1|c|@0.5')
+
+    def test_informant_response_timing(self):
+        app = middleware.Informant(
+            FakeApp(iter([('200 OK', {}, 'x' * 100)])),
+            {'statsd_sample_rate': '1', 'response_timing': 'yes'})
+        app._send_events = self.mock.fake_send_events
+        req = Request.blank('/v1/a/c/o')
+        req.environ['eventlet.posthooks'] = []
+        resp = app(req.environ, start_response)
+        self.assertTrue(isinstance(resp, middleware.ResponseTimer))
+        self.assertEquals(''.join(resp), 'x' * 100)
+        resp.close()
+        timer = req.environ['informant.response_timer']
+        self.assertEquals(timer.bytes_sent, 100)
+        self.assertTrue(timer.first_byte_time <= timer.last_byte_time)
+        req.environ['informant.start_time'] = 1331098000.0
+        timer.first_byte_time = 1331098000.5
+        timer.last_byte_time = 1331098001.5
+        hook, args, kwargs = req.environ['eventlet.posthooks'][0]
+        hook(req.environ, *args, **kwargs)
+        lines = self.mock._send_events_calls[0][0][0]
+        self.assertEquals(lines[4], 'ttfb.obj.GET.200:500|ms|@1.0')
+        self.assertEquals(lines[5], 'ttlb.obj.GET.200:1500|ms|@1.0')
+        self.assertEquals(lines[6], 'bps.obj.GET.200:100|ms|@1.0')
+
+    def test_informant_response_timing_no_body(self):
+        app = middleware.Informant(
+            FakeApp(iter([('204 No Content', {}, '')])),
+            {'statsd_sample_rate': '1', 'response_timing': 'yes'})
+        app._send_events = self.mock.fake_send_events
+        req = Request.blank('/v1/a/c/o')
+        req.environ['eventlet.posthooks'] = []
+        resp = app(req.environ, start_response)
+        list(resp)
+        hook, args, kwargs = req.environ['eventlet.posthooks'][0]
+        hook(req.environ, *args, **kwargs)
+        lines = self.mock._send_events_calls[0][0][0]
+        self.assertEquals(len(lines), 4)
+
+    def test_informant_upload_timing(self):
+        app = middleware.Informant(
+            FakeApp(iter([('201 Created', {}, '')])),
+            {'statsd_sample_rate': '1', 'upload_timing': 'yes'})
+        app._send_events = self.mock.fake_send_events
+        req = Request.blank('/v1/a/c/o', environ={'REQUEST_METHOD': 'PUT'},
+                            body='x' * 1000)
+        req.environ['eventlet.posthooks'] = []
+        app(req.environ, start_response)
+        wsgi_input = req.environ['wsgi.input']
+        self.assertTrue(isinstance(wsgi_input, middleware.InputTimer))
+        self.assertEquals(wsgi_input.read(), 'x' * 1000)
+        wsgi_input.first_read_time = 1331098000.0
+        wsgi_input.last_read_time = 1331098002.0
+        wsgi_input.read_time = 0.25
+        hook, args, kwargs = req.environ['eventlet.posthooks'][0]
+        hook(req.environ, *args, **kwargs)
+        lines = self.mock._send_events_calls[0][0][0]
+        self.assertEquals(lines[4], 'upload_bps.obj.PUT.201:500|ms|@1.0')
+        self.assertEquals(lines[5], 'upload_stall.obj.PUT.201:250|ms|@1.0')
+
+    def test_informant_upload_timing_get(self):
+        app = middleware.Informant(
+            FakeApp(iter([('200 OK', {}, '')])),
+            {'statsd_sample_rate': '1', 'upload_timing': 'yes'})
+        req = Request.blank('/v1/a/c/o')
+        req.environ['eventlet.posthooks'] = []
+        app(req.environ, start_response)
+        self.assertTrue('informant.input_timer' not in req.environ)
+
+    def test_informant_sample_deterministic(self):
+        picked = [self.app._sample('key', 0.25) for i in xrange(8)]
+        self.assertEquals(picked, [True, False, False, False] * 2)
+        self.assertEquals([self.app._sample('one', 1.0) for i in xrange(3)],
+                          [True] * 3)
+        self.assertEquals([self.app._sample('none', 0) for i in xrange(3)],
+                          [False] * 3)
+
+    def test_informant_class_rates(self):
+        app = middleware.Informant(FakeApp(), {
+            'statsd_sample_rate': '0.5',
+            'class_sample_rates': '5xx:1.0, obj.GET.2xx:0.01, '
+                                  'healthcheck:0.001, cont.GET:0.1'})
+        self.assertEquals(app._class_rate('obj', 'GET', '2xx'), 0.01)
+        self.assertEquals(app._class_rate('obj', 'GET', '5xx'), 1.0)
+        self.assertEquals(app._class_rate('obj', 'GET', '4xx'), 0.5)
+        self.assertEquals(app._class_rate('cont', 'GET', '2xx'), 0.1)
+        self.assertEquals(app._class_rate('cont', 'GET', '5xx'), 1.0)
+        self.assertEquals(app._class_rate('healthcheck', 'GET', '2xx'),
+                          0.001)
+        # without a status the highest possible rate is used
+        self.assertEquals(app._class_rate('obj', 'GET'), 1.0)
+
+    def _run_requests(self, app, path, status, count):
+        def fake_app(env, start_response):
+            start_response(status, [('Content-Length', '0')])
+            return []
+        app.app = fake_app
+        for i in xrange(count):
+            req = Request.blank(path)
+            req.environ['eventlet.posthooks'] = []
+            app(req.environ, start_response)
+            for hook, args, kwargs in req.environ['eventlet.posthooks']:
+                hook(req.environ, *args, **kwargs)
+
+    def test_informant_class_rates_sampling(self):
+        sent = []
+        app = middleware.Informant(FakeApp(), {
+            'class_sample_rates': '5xx:1.0, obj.GET.2xx:0.01'})
+        app._send_events = lambda payloads, combined: sent.append(payloads)
+        self._run_requests(app, '/v1/a/c/o', '200 OK', 200)
+        self.assertEquals(len(sent), 2)
+        self.assertEquals(sent[0][0], 'obj.GET.200:1|c|@0.01')
+        sent[:] = []
+        self._run_requests(app, '/v1/a/c/o', '503 Service Unavailable', 10)
+        self.assertEquals(len(sent), 10)
+        self.assertEquals(sent[0][0], 'obj.GET.503:1|c|@1.0')
+        sent[:] = []
+        self._run_requests(app, '/v1/a/c', '200 OK', 10)
+        self.assertEquals(len(sent), 5)
+        self.assertEquals(sent[0][0], 'cont.GET.200:1|c|@0.5')
+
+    def test_informant_adaptive_rate(self):
+        app = middleware.Informant(FakeApp(), {
+            'statsd_sample_rate': '1', 'target_events_per_second': '100'})
+        app._adaptive_window_start -= 2
+        app.reported = 1000
+        app._adapt_sample_rate()
+        self.assertEquals(app.adaptive_scale, 0.5)
+        app._adaptive_window_start -= 2
+        app.reported += 100
+        app._adapt_sample_rate()
+        self.assertEquals(app.adaptive_scale, 1.0)
+        app._adaptive_window_start -= 2
+        app.reported += 100
+        app._adapt_sample_rate()
+        self.assertEquals(app.adaptive_scale, 1.0)
+        app.adaptive_scale = 0.25
+        req = Request.blank('/v1/a/c/o')
+        self.assertTrue(app._send_sampled_event(req.environ))
+        self.assertEquals(req.environ['informant.sample_rate'], 0.25)
+
+    def test_informant_top_accounts(self):
+        app = middleware.Informant(FakeApp(), {'top_accounts': '2',
+                                               'statsd_sample_rate': '1'})
+        app._send_events = self.mock.fake_send_events
+        app._start_flusher = lambda: None
+        for acct, count, status in (('AUTH_a', 3, 200), ('AUTH_b', 5, 503),
+                                    ('AUTH_c', 1, 200)):
+            for i in xrange(count):
+                app._emit_records([middleware.EventRecord(
+                    'obj', 'GET', status, 10, 5, 100, acct, rate=1.0)])
+        app.flush_events()
+        lines = self.mock._send_events_calls[0][0][0]
+        self.assertEquals(lines, [
+            'top_accounts.AUTH_b.requests:5|c',
+            'top_accounts.AUTH_b.bytes:500|c',
+            'top_accounts.AUTH_b.errors:5|c',
+            'top_accounts.AUTH_a.requests:3|c',
+            'top_accounts.AUTH_a.bytes:300|c',
+            'top_accounts.AUTH_a.errors:0|c'])
+        self.assertEquals(app.heavy_hitters.counters, {})
+
+    def test_informant_top_accounts_hostile(self):
+        app = middleware.Informant(FakeApp(), {'top_accounts': '1',
+                                               'statsd_sample_rate': '1'})
+        app._send_events = self.mock.fake_send_events
+        app._start_flusher = lambda: None
+        req = Request.blank('/v1/evil:999|c%0Ainjected.metric:1000000/c/o')
+        stat_type, method, acct = app._request_class(req.environ)
+        self.assertEquals(acct, 'evil:999|c\ninjected.metric:1000000')
+        app._emit_records([middleware.EventRecord(
+            stat_type, method, 404, 10, 5, 0, acct, rate=1.0)])
+        app.flush_events()
+        lines = self.mock._send_events_calls[0][0][0]
+        self.assertEquals(lines[0], 'top_accounts.evil_999_c_injected_'
+                          'metric_1000000.requests:1|c')
+        for line in lines:
+            self.assertEquals(line.count(':'), 1, line)
+            self.assertFalse('\n' in line or '#' in line or '@' in line)
+        self.assertEquals(middleware.metric_safe('AUTH_a-b.c d#e@f,g'),
+                          'AUTH_a-b_c_d_e_f_g')
+
+    def test_informant_distinct_counts(self):
+        app = middleware.Informant(FakeApp(), {'distinct_counts': 'yes'})
+        app._send_events = self.mock.fake_send_events
+        app._start_flusher = lambda: None
+        for path in ('/v1/a', '/v1/a/c1', '/v1/a/c1/o1', '/v1/a/c1/o2',
+                     '/v1/b/c1/o1', '/v1/b/c1/o1', '/v1.0/b/c2/o/1',
+                     '/healthcheck', '/v1/', '/v1//c'):
+            app._count_distinct(path)
+        app.flush_events()
+        lines = self.mock._send_events_calls[0][0][0]
+        self.assertEquals(lines, ['distinct.accounts:2|g',
+                                  'distinct.containers:3|g',
+                                  'distinct.objects:4|g'])
+        app.flush_events()
+        lines = self.mock._send_events_calls[0][0][0]
+        self.assertEquals(lines, ['distinct.accounts:0|g',
+                                  'distinct.containers:0|g',
+                                  'distinct.objects:0|g'])
+
+    def _prometheus_app(self, **conf):
+        conf.update({'statsd_sample_rate': '1', 'statsd_events': 'no',
+                     'prometheus_path': '/informant/metrics'})
+        app = middleware.Informant(
+            FakeApp(iter([('200 OK', {}, 'x' * 10)] * 10)), conf)
+        app._send_events = self.mock.fake_send_events
+        app._start_flusher = lambda: None
+        return app
+
+    def _prometheus_request(self, app):
+        req = Request.blank('/v1/a/c/o')
+        req.environ['eventlet.posthooks'] = []
+        app(req.environ, start_response)
+        hook, args, kwargs = req.environ['eventlet.posthooks'][0]
+        hook(req.environ, *args, **kwargs)
+
+    def test_informant_prometheus(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tempdir, 'prometheus')
+            workers = [self._prometheus_app(prometheus_shared_path=path)
+                       for i in xrange(2)]
+            self._prometheus_request(workers[0])
+            self._prometheus_request(workers[1])
+            self._prometheus_request(workers[1])
+            self.assertEquals(self.mock._send_events_calls, [])
+            # worker 1 published its series on flush, worker 0 on scrape
+            workers[1].flush_events()
+            resp = Request.blank('/informant/metrics').get_response(
+                workers[0])
+            self.assertEquals(resp.status_int, 200)
+            self.assertEquals(resp.headers['Content-Type'],
+                              'text/plain; version=0.0.4')
+            line = 'informant_requests_total{type="obj",method="GET",' \
+                'status="200"} 3\n'
+            self.assertTrue(line in resp.body, resp.body)
+            resp = Request.blank('/informant/metrics').get_response(
+                workers[1])
+            self.assertTrue(line in resp.body, resp.body)
+            resp = Request.blank('/informant/metrics',
+                                 environ={'REQUEST_METHOD': 'PUT'}
+                                 ).get_response(workers[0])
+            self.assertEquals(resp.status_int, 405)
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_informant_prometheus_cardinality_limit(self):
+        app = self._prometheus_app(prometheus_shared='no',
+                                   cardinality_limits='status:2')
+        app._start_flusher = lambda: None
+        for interval in xrange(2):
+            for status in (200, 404 + interval, 500 + interval):
+                app._observe_request({}, middleware.EventRecord(
+                    'obj', 'GET', status, 10, 5, 500, None, rate=1.0))
+            # the interval guard resets, the prometheus one doesn't
+            app.cardinality.take()
+        self.assertEquals(sorted(app.prometheus.series), [
+            ('obj', 'GET', 200), ('obj', 'GET', 404),
+            ('obj', 'GET', 'other')])
+        self.assertEquals(
+            app.prometheus.series[('obj', 'GET', 'other')].requests, 3)
+
+    def test_informant_prometheus_counts_unsampled_requests(self):
+        app = self._prometheus_app(prometheus_shared='no')
+        app.statsd_sample_rate = 0.5
+        for i in xrange(4):
+            self._prometheus_request(app)
+        self.assertEquals(app.posthooks_added, 2)
+        series = app.prometheus.series[('obj', 'GET', 200)]
+        self.assertEquals(series.requests, 4)
+        self.assertEquals(sum(series.duration_buckets), 4)
+
+    def test_informant_prometheus_per_worker(self):
+        app = self._prometheus_app(prometheus_shared='no')
+        self.assertEquals(app.prometheus_shared, None)
+        self._prometheus_request(app)
+        resp = Request.blank('/informant/metrics').get_response(app)
+        self.assertTrue('informant_requests_total{type="obj",method="GET",'
+                        'status="200",worker="%d"} 1\n' % os.getpid()
+                        in resp.body, resp.body)
+
+    def test_informant_dogstatsd_emitter(self):
+        app = middleware.Informant(FakeApp(), {
+            'emitter': 'dogstatsd', 'prefix_accounts': 'someaccount'})
+        app._send_events = self.mock.fake_send_events
+        req = self._obj_req()
+        orig_time = middleware.time
+        middleware.time = self.mock.fake_time
+        try:
+            app.statsd_event(req.environ, req)
+        finally:
+            middleware.time = orig_time
+        lines = self.mock._send_events_calls[0][0][0]
+        tags = 'type:obj,method:GET,status:200'
+        self.assertEquals(lines[:4], [
+            'requests:1|c|@0.5|#' + tags,
+            'duration:500000|ms|@0.5|#' + tags,
+            'srt:9|ms|@0.5|#' + tags,
+            'tfer:500|c|@0.5|#' + tags])
+        self.assertEquals(lines[4:], [
+            'requests:1|c|@0.5|#%s,account:someaccount' % tags,
+            'duration:500000|ms|@0.5|#type:obj,account:someaccount',
+            'srt:9|ms|@0.5|#%s,account:someaccount' % tags])
+
+    def test_informant_graphite_emitter(self):
+        app = middleware.Informant(FakeApp(), {'emitter': 'graphite',
+                                               'statsd_sample_rate': '1'})
+        self.assertTrue(app.aggregate_events)
+        self.assertEquals(app.sender.port, 2003)
+        app._send_events = self.mock.fake_send_events
+        app._start_flusher = lambda: None
+        req = self._obj_req()
+        app.statsd_event(req.environ, req)
+        self.assertEquals(self.mock._send_events_calls, [])
+        app.flush_events()
+        lines = self.mock._send_events_calls[0][0][0]
+        self.assertTrue([l for l in lines if l.startswith(
+            'tfer.obj.GET.200 500 ')], lines)
+        self.assertTrue([l for l in lines if l.startswith(
+            'srt.obj.GET.200.count 1 ')], lines)
+
+    def test_informant_unknown_emitter(self):
+        self.assertRaises(ValueError, middleware.Informant, FakeApp(),
+                          {'emitter': 'carbon'})
+
+    def test_informant_slow_requests(self):
+        app = middleware.Informant(FakeApp(), {
+            'slow_request_threshold': '1000',
+            'slow_request_path': '/informant/slow'})
+        app._send_events = self.mock.fake_send_events
+        req = self._obj_req()
+        req.environ['swift.trans_id'] = 'tx-slow'
+        app.statsd_event(req.environ, req)
+        req = self._obj_req()
+        req.environ['informant.start_time'] = middleware.time()
+        app.statsd_event(req.environ, req)
+        entries = app.slow_requests.requests()
+        self.assertEquals(len(entries), 1)
+        self.assertEquals((entries[0].trans_id, entries[0].method,
+                           entries[0].stat_type, entries[0].acct,
+                           entries[0].status, entries[0].transferred),
+                          ('tx-slow', 'GET', 'obj', 'someaccount', 200, 500))
+        resp = Request.blank('/informant/slow', environ={
+            'REMOTE_ADDR': '127.0.0.1'}).get_response(app)
+        self.assertEquals(resp.status_int, 200)
+        self.assertEquals(resp.headers['Content-Type'], 'application/json')
+        self.assertTrue('"trans_id": "tx-slow"' in resp.body, resp.body)
+        for addr in ('10.1.2.3', None):
+            req = Request.blank('/informant/slow')
+            if addr:
+                req.environ['REMOTE_ADDR'] = addr
+            resp = req.get_response(app)
+            self.assertEquals(resp.status_int, 403)
+            self.assertEquals(resp.body, '')
+        app = middleware.Informant(FakeApp(), {
+            'slow_request_path': '/informant/slow',
+            'slow_request_allowed_addrs': '10.1.2.3, 10.1.2.4'})
+        resp = Request.blank('/informant/slow', environ={
+            'REMOTE_ADDR': '10.1.2.4'}).get_response(app)
+        self.assertEquals(resp.status_int, 200)
+
+    def test_informant_slow_requests_unsampled(self):
+        app = middleware.Informant(FakeApp(), {
+            'slow_request_threshold': '1000', 'statsd_sample_rate': '0'})
+        app._send_events = self.mock.fake_send_events
+        req = Request.blank('/v1/a/c/o', environ={
+            'swift.trans_id': 'tx-unsampled', 'eventlet.posthooks': []})
+        orig_time = middleware.time
+        try:
+            middleware.time = lambda: 1331098000.0
+            app(req.environ, start_response)
+            middleware.time = self.mock.fake_time
+            hook, args, kwargs = req.environ['eventlet.posthooks'][0]
+            self.assertEquals(hook, app.unsampled_event)
+            hook(req.environ, *args, **kwargs)
+        finally:
+            middleware.time = orig_time
+        self.assertEquals(app.posthooks_added, 0)
+        entries = app.slow_requests.requests()
+        self.assertEquals([(e.trans_id, e.status, e.duration)
+                           for e in entries],
+                          [('tx-unsampled', 404, 500000)])
+        self.assertEquals(self.mock._send_events_calls, [])
+
+    def test_informant_slow_requests_disabled(self):
+        req = self._obj_req()
+        self.app.statsd_event(req.environ, req)
+        self.assertEquals(self.app.slow_requests.recorded, 0)
+        resp = Request.blank('/informant/slow').get_response(self.app)
+        self.assertEquals(resp.status_int, 404)
+
+    def test_informant_send_backoff(self):
+
+        class FlakySender(object):
+            fail = True
+            sent = []
+            closed = 0
+
+            def send(self, payloads, combined_events=False):
+                if self.fail:
+                    raise IOError('No buffer space available')
+                self.sent.append(payloads)
+
+            def close(self):
+                self.closed += 1
+
+        app = middleware.Informant(FakeApp(), {
+            'send_failure_threshold': '2', 'send_backoff_initial': '100'})
+        app.sender = FlakySender()
+        errors = []
+        app.logger.error = lambda msg, *a, **kw: errors.append(msg)
+        app.logger.info = lambda msg, *a, **kw: None
+        for i in xrange(5):
+            app._send_events(['a:1|c', 'b:1|c'])
+        self.assertEquals(app.backoff.errors, 2)
+        self.assertEquals(app.backoff.dropped, 10)
+        self.assertEquals(app.sender.closed, 2)
+        self.assertEquals(len(errors), 1)
+        # events aren't formatted while backing off
+        app._record_lines = None
+        app._emit_records([middleware.EventRecord(
+            'obj', 'GET', 200, 10, 5, 500, None, rate=1.0)] * 3)
+        self.assertEquals(app.backoff.dropped, 10)
+        self.assertEquals(app.backoff.dropped_events, 3)
+        self.assertEquals(app.dropped_events, 3)
+        del app._record_lines
+        app.sender.fail = False
+        app.backoff.until = 0
+        app._send_events(['c:1|c'])
+        self.assertEquals(app.sender.sent, [
+            ['c:1|c'], ['informant.send_errors:2|c',
+                        'informant.dropped_lines:10|c',
+                        'informant.dropped_events:3|c']])
+        self.assertEquals(app.backoff.errors, 0)
+
+    def test_informant_statsd_event_errors_rate_limited(self):
+        errors = []
+        self.app.logger.error = lambda msg, *a, **kw: errors.append(msg)
+        self.app._event_record = None
+        for i in xrange(3):
+            self.app.statsd_event({}, None)
+        self.assertEquals(errors, ['Encountered error in statsd_event'])
+        self.app._last_error_log.clear()
+        self.app.statsd_event({}, None)
+        self.assertEquals(errors[1], 'Encountered error in statsd_event '
+                          '(2 similar errors suppressed)')
+
+    def test_informant_self_metrics(self):
+        app = middleware.Informant(FakeApp(), {'self_metrics': 'yes',
+                                               'statsd_sample_rate': '1'})
+        app._start_flusher = lambda: None
+        app.sender.sock = FakeSocket()
+        app.sender.addr = ('127.0.0.1', 8125)
+        for i in xrange(4):
+            app._send_sampled_event({})
+        for i in xrange(2):
+            req = self._obj_req()
+            app.statsd_event(req.environ, req)
+        app.dropped_events = 3
+        app.flush_events()
+        lines = app.sender.sock.sent[-12:]
+        self.assertTrue('informant.statsd_event.calls:2|g' in lines, lines)
+        self.assertTrue('informant.send_events.calls:2|g' in lines, lines)
+        self.assertTrue('informant.packets:8|g' in lines, lines)
+        self.assertTrue('informant.lines_dropped:0|g' in lines, lines)
+        self.assertTrue('informant.events_dropped:3|g' in lines, lines)
+        self.assertTrue('informant.actual_rate_ppm:500000|g' in lines,
+                        lines)
+        self.assertTrue('informant.templates:1|g' in lines, lines)
+        app.flush_events()
+        lines = app.sender.sock.sent[-12:]
+        self.assertTrue('informant.statsd_event.calls:0|g' in lines, lines)
+        self.assertTrue('informant.packets:12|g' in lines, lines)
+        self.assertTrue('informant.lines_dropped:0|g' in lines, lines)
+
+    def test_informant_subrequest_fanout(self):
+
+        class FakeSLO(object):
+
+            def __init__(self, app):
+                self.app = app
+
+            def __call__(self, env, start_response):
+                self.app(env, start_response)
+                for i in xrange(3):
+                    # like make_subrequest, only a few keys are copied
+                    sub = Request.blank('/v1/a/c/seg%d' % i, environ={
+                        'swift.trans_id': env['swift.trans_id'],
+                        'swift.source': 'SLO'})
+                    sub.get_response(self.app).body
+                start_response('200 OK', [('Content-Length', '0')])
+                return []
+
+        def catch_errors(env, start_response):
+            env['swift.trans_id'] = 'tx-fanout'
+            return slo(env, start_response)
+
+        collector = middleware.fanout.FanOutCollector(
+            FakeApp(iter([('200 OK', {}, 'x' * 10)] * 4)))
+        slo = FakeSLO(collector)
+        app = middleware.Informant(catch_errors, {
+            'subrequest_fanout': 'yes', 'statsd_sample_rate': '1'})
+        app._send_events = self.mock.fake_send_events
+        req = Request.blank('/v1/a/c/manifest')
+        req.environ['eventlet.posthooks'] = []
+        app(req.environ, start_response)
+        hook, args, kwargs = req.environ['eventlet.posthooks'][0]
+        hook(req.environ, *args, **kwargs)
+        lines = self.mock._send_events_calls[0][0][0]
+        self.assertTrue('subreqs.obj.GET.SLO.count:3|ms|@1.0' in lines,
+                        lines)
+        self.assertTrue('subreqs.obj.GET.SLO.bytes:30|c|@1.0' in lines,
+                        lines)
+        self.assertTrue([l for l in lines
+                         if l.startswith('subreqs.obj.GET.SLO.time:')])
+        self.assertEquals(middleware.fanout.CONTEXTS, {})
+
+    def test_informant_subrequest_fanout_before_forwarding(self):
+
+        class FakeBulk(object):
+            """Deletes objects with subrequests, never calls down"""
+
+            def __init__(self, app):
+                self.app = app
+
+            def __call__(self, env, start_response):
+                for i in xrange(2):
+                    sub = Request.blank('/v1/a/c/o%d' % i, environ={
+                        'REQUEST_METHOD': 'DELETE',
+                        'swift.trans_id': env['swift.trans_id'],
+                        'swift.source': 'BD'})
+                    sub.get_response(self.app).body
+                start_response('200 OK', [('Content-Length', '0')])
+                return []
+
+        def catch_errors(env, start_response):
+            env['swift.trans_id'] = 'tx-bulk'
+            return registrar(env, start_response)
+
+        collector = middleware.fanout.FanOutCollector(
+            FakeApp(iter([('204 No Content', {}, '')] * 2)))
+        registrar = middleware.fanout.FanOutRegistrar(FakeBulk(collector))
+        app = middleware.Informant(catch_errors, {
+            'subrequest_fanout': 'yes', 'statsd_sample_rate': '1'})
+        app._send_events = self.mock.fake_send_events
+        req = Request.blank('/v1/a?bulk-delete', environ={
+            'REQUEST_METHOD': 'POST'})
+        req.environ['eventlet.posthooks'] = []
+        app(req.environ, start_response)
+        hook, args, kwargs = req.environ['eventlet.posthooks'][0]
+        hook(req.environ, *args, **kwargs)
+        lines = self.mock._send_events_calls[0][0][0]
+        self.assertTrue('subreqs.acct.POST.BD.count:2|ms|@1.0' in lines,
+                        lines)
+        self.assertEquals(middleware.fanout.CONTEXTS, {})
+
+    def test_informant_subrequest_without_client_context(self):
+        app = middleware.fanout.FanOutCollector(FakeApp())
+        req = Request.blank('/v1/a/c/o', environ={
+            'swift.trans_id': 'tx-unknown', 'swift.source': 'SLO',
+            'eventlet.posthooks': []})
+        resp = req.get_response(app)
+        self.assertEquals(resp.status_int, 404)
+        self.assertEquals(req.environ['eventlet.posthooks'], [])
+
+    def test_informant_inflight_gauges(self):
+        app = middleware.Informant(
+            FakeApp(iter([('200 OK', {}, 'x' * 10)] * 3)),
+            {'inflight_gauges': 'yes', 'statsd_sample_rate': '0'})
+        app._start_flusher = lambda: None
+        app._send_events = self.mock.fake_send_events
+        envs = []
+        responses = []
+        for i in xrange(3):
+            req = Request.blank('/v1/a/c/o')
+            req.environ['eventlet.posthooks'] = []
+            envs.append(req.environ)
+            responses.append(app(req.environ, start_response))
+        # a client that went away mid body still gets its response closed
+        iter(responses[0]).next()
+        responses[0].close()
+        # and if it's never closed the posthook cleans up
+        hook, args, kwargs = envs[1]['eventlet.posthooks'][0]
+        hook(envs[1], *args, **kwargs)
+        responses[1].close()
+        app.flush_events()
+        lines = self.mock._send_events_calls[0][0][0]
+        self.assertTrue('inflight.obj.GET:1|g' in lines, lines)
+        self.assertTrue('inflight.obj.GET.peak:3|g' in lines, lines)
+        self.assertTrue('inflight.total:1|g' in lines, lines)
+        self.assertTrue('inflight.total.peak:3|g' in lines, lines)
+        responses[2].close()
+        self.assertEquals(app.inflight.total, 0)
+
+    def test_informant_hub_lag_monitor(self):
+        started = []
+        orig_start = middleware.Informant.start_watchdog
+        middleware.Informant.start_watchdog = \
+            lambda self: started.append(self)
+        try:
+            app = middleware.filter_factory(
+                {}, hub_lag_monitor='yes')(FakeApp())
+            middleware.filter_factory({})(FakeApp())
+        finally:
+            middleware.Informant.start_watchdog = orig_start
+        self.assertEquals(started, [app])
+        app._send_events = self.mock.fake_send_events
+        app.watchdog.lags.record(100)
+        app.watchdog.lags.record(2000)
+        app.posthooks_added = 5
+        app.statsd_event_calls = 3
+        app.flush_events()
+        lines = self.mock._send_events_calls[0][0][0]
+        self.assertTrue('hub.lag_us.count:2|g' in lines, lines)
+        self.assertTrue('hub.lag_us.max:2000|g' in lines, lines)
+        self.assertTrue([l for l in lines
+                         if l.startswith('hub.lag_us.p50:')], lines)
+        self.assertTrue('hub.pending_posthooks:2|g' in lines, lines)
+        self.assertTrue([l for l in lines
+                         if l.startswith('hub.waiting_timers:')], lines)
+
+    def test_size_buckets(self):
+        buckets = middleware.SizeBuckets('64K, 4k,1M')
+        self.assertEquals(buckets.boundaries, [4096, 65536, 1048576])
+        self.assertEquals(buckets.labels,
+                          ('lt4K', 'lt64K', 'lt1M', 'ge1M'))
+        for size, label in ((0, 'lt4K'), (4095, 'lt4K'), (4096, 'lt64K'),
+                            (1048575, 'lt1M'), (1048576, 'ge1M'),
+                            (5 << 30, 'ge1M')):
+            self.assertEquals(buckets.label(size), label)
+        self.assertEquals(middleware.SizeBuckets().labels,
+                          ('lt4K', 'lt64K', 'lt1M', 'lt16M', 'lt256M',
+                           'ge256M'))
+        self.assertEquals(middleware.SizeBuckets('1000,2G').labels,
+                          ('lt1000', 'lt2G', 'ge2G'))
+        self.assertRaises(ValueError, middleware.SizeBuckets, '')
+        self.assertRaises(ValueError, middleware.SizeBuckets, '4X')
+
+    def test_informant_size_metrics(self):
+        app = middleware.Informant(FakeApp(), {'size_metrics': 'yes'})
+        app._send_events = self.mock.fake_send_events
+        req = self._obj_req()
+        orig_time = middleware.time
+        middleware.time = self.mock.fake_time
+        try:
+            app.statsd_event(req.environ, req)
+        finally:
+            middleware.time = orig_time
+        lines = self.mock._send_events_calls[0][0][0]
+        self.assertEquals(lines[4], 'size.obj.GET.200.lt4K:500000|ms|@0.5')
+        self.assertEquals(lines[5],
+                          'ms_per_mb.obj.GET.200.lt4K:1048576000|ms|@0.5')
+
+    def test_informant_size_metrics_content_length(self):
+        app = middleware.Informant(
+            FakeApp(iter([('200 OK', {}, 'x' * 100000)])),
+            {'size_metrics': 'yes', 'size_buckets': '4K,64K,1M'})
+        app._send_events = self.mock.fake_send_events
+        req = Request.blank('/v1/a/c/o')
+        req.environ['eventlet.posthooks'] = []
+        list(app(req.environ, start_response))
+        self.assertEquals(req.environ['informant.content_length'], '100000')
+        hook, args, kwargs = req.environ['eventlet.posthooks'][0]
+        hook(req.environ, *args, **kwargs)
+        lines = self.mock._send_events_calls[0][0][0]
+        self.assertTrue(lines[4].startswith('size.obj.GET.200.lt1M:'),
+                        lines)
+        # nothing transferred, no throughput
+        self.assertEquals(len(lines), 5)
+        # uploads are sized by the request's Content-Length
+        req = self._obj_req()
+        req.method = 'PUT'
+        req.environ['CONTENT_LENGTH'] = '70000'
+        record = app._event_record(req.environ, req)
+        self.assertEquals(record.size_bucket, 'lt1M')
+        # falling back to the bytes transferred
+        del req.environ['CONTENT_LENGTH']
+        record = app._event_record(req.environ, req)
+        self.assertEquals(record.size_bucket, 'lt4K')
+
+    def test_informant_size_metrics_objects_only(self):
+        app = middleware.Informant(FakeApp(), {'size_metrics': 'yes'})
+        req = self._obj_req()
+        req.path_info = '/v1/someaccount/somecontainer'
+        record = app._event_record(req.environ, req)
+        self.assertEquals(record.size_bucket, None)
+        self.assertEquals(record.ms_per_mb, None)
+        self.assertEquals(len(app._record_lines(record)), 4)
+
+    def test_informant_cardinality_limit(self):
+        app = middleware.Informant(FakeApp(), {
+            'cardinality_limit': '2', 'cardinality_limits': 'status:1'})
+        self.assertEquals(app.cardinality.limits,
+                          {'type': 2, 'status': 1, 'source': 2})
+        app._send_events = self.mock.fake_send_events
+        app._start_flusher = lambda: None
+        app._emit_records([
+            middleware.EventRecord(stat_type, 'GET', status, 10, 5, 500,
+                                   None, rate=1.0)
+            for stat_type, status in (('obj', 200), ('cont', 404),
+                                      ('FOO', 200))])
+        lines = self.mock._send_events_calls[0][0][0]
+        self.assertEquals(lines[0], 'obj.GET.200:1|c|@1.0')
+        self.assertEquals(lines[4], 'cont.GET.other:1|c|@1.0')
+        self.assertEquals(lines[8], 'other.GET.200:1|c|@1.0')
+        app.flush_events()
+        self.assertEquals(self.mock._send_events_calls[0][0][0], [
+            'cardinality.folded.source:0|c',
+            'cardinality.folded.status:1|c',
+            'cardinality.folded.type:1|c'])
+        self.assertEquals(middleware.Informant(FakeApp(), {}).cardinality,
+                          None)
+        self.assertEquals(app.prometheus_cardinality, None)
+        self.assertRaises(ValueError, middleware.Informant, FakeApp(),
+                          {'cardinality_limits': 'acct:10'})
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from informant.prometheus import PrometheusRegistry, SharedRegistry, \
+    escape_label
+
+
+class TestPrometheusRegistry(unittest.TestCase):
+
+    def test_render(self):
+        registry = PrometheusRegistry(buckets=(0.1, 1))
+        registry.observe('obj', 'GET', 200, 0.05, 0.01, 100)
+        registry.observe('obj', 'GET', 200, 0.5, 0.01, 100)
+        registry.observe('obj', 'GET', 200, 0.5, 0.01, 100)
+        text = registry.render()
+        labels = 'type="obj",method="GET",status="200"'
+        for line in (
+                '# TYPE informant_requests_total counter',
+                'informant_requests_total{%s} 3' % labels,
+                'informant_transferred_bytes_total{%s} 300' % labels,
+                '# TYPE informant_request_duration_seconds histogram',
+                'informant_request_duration_seconds_bucket{%s,le="0.1"} 1'
+                % labels,
+                'informant_request_duration_seconds_bucket{%s,le="1"} 3'
+                % labels,
+                'informant_request_duration_seconds_bucket{%s,le="+Inf"} 3'
+                % labels,
+                'informant_request_duration_seconds_sum{%s} 1.05' % labels,
+                'informant_request_duration_seconds_count{%s} 3' % labels,
+                'informant_start_response_seconds_count{%s} 3' % labels):
+            self.assertTrue(line + '\n' in text, line)
+
+    def test_unchanged_series_not_rendered_again(self):
+        registry = PrometheusRegistry()
+        registry.observe('obj', 'GET', 200, 0.05, 0.01, 100)
+        registry.observe('cont', 'GET', 200, 0.05, 0.01, 100)
+        registry.render()
+        obj = registry.series[('obj', 'GET', 200)]
+        cont = registry.series[('cont', 'GET', 200)]
+        cached = cont.rendered
+        registry.observe('obj', 'GET', 200, 0.05, 0.01, 100)
+        self.assertEquals(obj.rendered, None)
+        text = registry.render()
+        self.assertTrue(cont.rendered is cached)
+        self.assertTrue(
+            'informant_requests_total{type="obj",method="GET",status="200"}'
+            ' 2\n' in text)
+
+    def test_take_merge_restore(self):
+        registry = PrometheusRegistry(buckets=(0.1, 1))
+        registry.observe('obj', 'GET', 200, 0.05, 0.01, 100)
+        state = registry.take()
+        self.assertEquals(registry.series, {})
+        self.assertEquals(state, {('obj', 'GET', 200): [
+            1, 100, [1, 0, 0], 0.05, [1, 0, 0], 0.01]})
+        registry.observe('obj', 'GET', 200, 0.5, 0.01, 100)
+        registry.merge(state, registry.take())
+        self.assertEquals(state[('obj', 'GET', 200)][:3], [2, 200, [1, 1, 0]])
+        registry.restore(state)
+        self.assertEquals(registry.take(), state)
+        self.assertTrue('informant_requests_total{type="obj",method="GET",'
+                        'status="200"} 2\n' in registry.render_state(state))
+
+    def test_escape_label(self):
+        self.assertEquals(escape_label('a"b\\c\nd'), 'a\\"b\\\\c\\nd')
+
+
+class TestSharedRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'prometheus')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_node_totals(self):
+        workers = [SharedRegistry(PrometheusRegistry(), self.path, 4096)
+                   for i in xrange(2)]
+        line = 'informant_requests_total{type="obj",method="GET",' \
+            'status="200"} %d\n'
+        workers[0].registry.observe('obj', 'GET', 200, 0.05, 0.01, 100)
+        workers[1].registry.observe('obj', 'GET', 200, 0.05, 0.01, 100)
+        workers[1].publish()
+        self.assertTrue(line % 2 in workers[0].render())
+        # totals never go backwards whichever worker is scraped
+        self.assertTrue(line % 2 in workers[1].render())
+        workers[1].registry.observe('obj', 'GET', 200, 0.05, 0.01, 100)
+        self.assertTrue(line % 3 in workers[1].render())
+        self.assertTrue(line % 3 in workers[0].render())
+
+    def test_unchanged_series_not_rendered_again(self):
+        worker = SharedRegistry(PrometheusRegistry(), self.path, 4096)
+        worker.registry.observe('obj', 'GET', 200, 0.05, 0.01, 100)
+        worker.registry.observe('cont', 'GET', 200, 0.05, 0.01, 100)
+        worker.render()
+        obj = worker.rendered[('obj', 'GET', 200)][1]
+        cont = worker.rendered[('cont', 'GET', 200)][1]
+        worker.registry.observe('obj', 'GET', 200, 0.05, 0.01, 100)
+        text = worker.render()
+        self.assertTrue(worker.rendered[('cont', 'GET', 200)][1] is cont)
+        self.assertFalse(worker.rendered[('obj', 'GET', 200)][1] is obj)
+        self.assertTrue(
+            'informant_requests_total{type="obj",method="GET",status="200"}'
+            ' 2\n' in text)
+
+    def test_nothing_pending_not_written(self):
+        worker = SharedRegistry(PrometheusRegistry(), self.path, 4096)
+        worker.registry.observe('obj', 'GET', 200, 0.05, 0.01, 100)
+        worker.publish()
+        writes = []
+        worker._write = writes.append
+        self.assertTrue('status="200"} 1\n' in worker.render())
+        self.assertEquals(writes, [])
+
+    def test_overflow_kept(self):
+        worker = SharedRegistry(PrometheusRegistry(), self.path, 64)
+        worker.registry.observe('obj', 'GET', 200, 0.05, 0.01, 100)
+        self.assertTrue('status="200"} 1\n' in worker.render())
+        self.assertTrue(worker.overflowed)
+        self.assertEquals(worker.registry.series[('obj', 'GET', 200)]
+                          .requests, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
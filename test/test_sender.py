@@ -0,0 +1,145 @@
+import unittest
+
+from informant.sender import StatsdSender, GraphiteSender, Backoff
+
+
+class FakeSocket(object):
+
+    def __init__(self):
+        self.sent = []
+        self.fail = False
+        self.closed = False
+
+    def sendto(self, payload, addr):
+        self.sent.append(payload)
+        return len(payload)
+
+    def sendall(self, data):
+        if self.fail:
+            raise IOError('connection reset')
+        self.sent.append(data)
+
+    def close(self):
+        self.closed = True
+
+
+class TestStatsdSender(unittest.TestCase):
+
+    def setUp(self):
+        self.sender = StatsdSender('127.0.0.1', 8125, max_packet_size=20)
+        self.sender.sock = FakeSocket()
+        self.sender.addr = ('127.0.0.1', 8125)
+
+    def test_packets_split_on_max_size(self):
+        payloads = ['a' * 9, 'b' * 10, 'c' * 5, 'd' * 30, 'e']
+        self.assertEquals(list(self.sender.packets(payloads)),
+                          [['a' * 9, 'b' * 10], ['c' * 5], ['d' * 30],
+                           ['e']])
+
+    def test_send_uncombined(self):
+        self.sender.send(['a:1|c', 'b:1|c'])
+        self.assertEquals(self.sender.sock.sent, ['a:1|c', 'b:1|c'])
+
+    def test_send_combined(self):
+        self.sender.send(['a' * 9, 'b' * 10, 'c' * 5], True)
+        self.assertEquals(self.sender.sock.sent,
+                          ['a' * 9 + '\n' + 'b' * 10, 'c' * 5])
+        self.assertEquals(self.sender.packets_sent, 2)
+        self.assertEquals(self.sender.bytes_sent, 25)
+
+    def test_socket_reused(self):
+        sender = StatsdSender('127.0.0.1', 8125)
+        sender.send(['a:1|c'])
+        sock = sender.sock
+        sender.send(['a:1|c'])
+        self.assertTrue(sender.sock is sock)
+        sender.close()
+        self.assertEquals(sender.sock, None)
+
+
+class TestGraphiteSender(unittest.TestCase):
+
+    def setUp(self):
+        self.sender = GraphiteSender('127.0.0.1', 2003, max_batch_size=20,
+                                     pool_size=1)
+        self.socks = []
+
+        def fake_connect():
+            self.socks.append(FakeSocket())
+            return self.socks[-1]
+        self.sender._connect = fake_connect
+
+    def test_batches(self):
+        payloads = ['a' * 9, 'b' * 9, 'c' * 5, 'd' * 30]
+        self.assertEquals(list(self.sender.batches(payloads)),
+                          ['a' * 9 + '\n' + 'b' * 9 + '\n',
+                           'c' * 5 + '\n', 'd' * 30 + '\n'])
+
+    def test_connection_pooled(self):
+        self.sender.send(['a 1 1331098500'])
+        self.sender.send(['b 1 1331098500'])
+        self.assertEquals(len(self.socks), 1)
+        self.assertEquals(self.socks[0].sent, ['a 1 1331098500\n',
+                                               'b 1 1331098500\n'])
+        self.sender.close()
+        self.assertTrue(self.socks[0].closed)
+        self.assertEquals(self.sender.pool, [])
+
+    def test_reconnect_after_error(self):
+        self.sender.send(['a 1 1331098500'])
+        self.socks[0].fail = True
+        self.assertRaises(IOError, self.sender.send, ['b 1 1331098500'])
+        self.assertTrue(self.socks[0].closed)
+        self.assertEquals(self.sender.pool, [])
+        self.sender.send(['c 1 1331098500'])
+        self.assertEquals(len(self.socks), 2)
+        self.assertEquals(self.socks[1].sent, ['c 1 1331098500\n'])
+
+    def test_real_connection(self):
+        from eventlet.green import socket
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        sender = GraphiteSender('127.0.0.1', listener.getsockname()[1])
+        sender.send(['a 1 1331098500', 'b 2 1331098500'])
+        conn, _junk = listener.accept()
+        sender.close()
+        data = ''
+        while True:
+            chunk = conn.recv(1024)
+            if not chunk:
+                break
+            data += chunk
+        conn.close()
+        listener.close()
+        self.assertEquals(data, 'a 1 1331098500\nb 2 1331098500\n')
+
+
+class TestBackoff(unittest.TestCase):
+
+    def test_backoff_after_threshold(self):
+        backoff = Backoff(threshold=2, initial=1, max_delay=4)
+        backoff.failure(100)
+        self.assertTrue(backoff.allowed(100))
+        backoff.failure(100)
+        self.assertFalse(backoff.allowed(100.5))
+        self.assertTrue(backoff.allowed(101))
+        backoff.failure(101)
+        self.assertFalse(backoff.allowed(102.5))
+        self.assertTrue(backoff.allowed(103))
+        for i in xrange(10):
+            backoff.failure(103)
+        self.assertTrue(backoff.allowed(107))
+
+    def test_success_resets(self):
+        backoff = Backoff(threshold=1)
+        backoff.failure(100)
+        backoff.dropped += 5
+        backoff.dropped_events += 2
+        self.assertEquals(backoff.success(), (1, 5, 2))
+        self.assertTrue(backoff.allowed(100))
+        self.assertEquals(backoff.success(), (0, 0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
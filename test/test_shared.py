@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from informant.aggregator import Aggregator
+from informant.shared import SharedAggregator, HEADER
+
+
+class TestSharedAggregator(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'informant')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_single_flusher(self):
+        agg_a = Aggregator()
+        agg_b = Aggregator()
+        worker_a = SharedAggregator(agg_a, self.path, 4096)
+        worker_b = SharedAggregator(agg_b, self.path, 4096)
+        agg_a.add([('obj.GET.200', 1, 'c'), ('obj.GET.200', 10, 'ms')])
+        self.assertEquals(sorted(worker_a.flush()), [
+            'obj.GET.200.count:1|g', 'obj.GET.200.lower:10|g',
+            'obj.GET.200.mean:10|g', 'obj.GET.200.upper:10|g',
+            'obj.GET.200:1|c'])
+        self.assertTrue(worker_a.leader)
+        agg_b.add([('obj.GET.200', 1, 'c'), ('obj.GET.200', 30, 'ms')])
+        agg_b.add([('obj.PUT.201', 1, 'c')])
+        self.assertEquals(worker_b.flush(), [])
+        self.assertFalse(worker_b.leader)
+        agg_a.add([('obj.GET.200', 1, 'c'), ('obj.GET.200', 20, 'ms')])
+        self.assertEquals(sorted(worker_a.flush()), [
+            'obj.GET.200.count:2|g', 'obj.GET.200.lower:20|g',
+            'obj.GET.200.mean:25|g', 'obj.GET.200.upper:30|g',
+            'obj.GET.200:2|c', 'obj.PUT.201:1|c'])
+        self.assertEquals(worker_a.flush(), [])
+
+    def test_histograms_merged(self):
+        agg_a = Aggregator(histograms=True, percentiles=(50,))
+        agg_b = Aggregator(histograms=True, percentiles=(50,))
+        worker_a = SharedAggregator(agg_a, self.path, 4096)
+        worker_b = SharedAggregator(agg_b, self.path, 4096)
+        worker_a.flush()
+        for value in xrange(1, 51):
+            agg_b.timing('obj.GET.200', value)
+        worker_b.flush()
+        for value in xrange(51, 101):
+            agg_a.timing('obj.GET.200', value)
+        self.assertEquals(sorted(worker_a.flush()), [
+            'obj.GET.200.count:100|g', 'obj.GET.200.max:100|g',
+            'obj.GET.200.p50:50|g'])
+
+    def test_overflow_sent_directly(self):
+        agg = Aggregator()
+        worker = SharedAggregator(agg, self.path, 16)
+        worker._open()
+        worker.leader = False
+        worker._elect = lambda: False
+        agg.add([('obj.GET.200', 1, 'c')])
+        self.assertEquals(worker.flush(), ['obj.GET.200:1|c'])
+
+    def test_unreadable_region_discarded(self):
+        logged = []
+
+        class FakeLogger(object):
+            def error(self, msg):
+                logged.append(msg)
+
+        agg = Aggregator()
+        worker = SharedAggregator(agg, self.path, 4096, FakeLogger())
+        worker._open()
+        worker._elect = lambda: False
+        agg.add([('obj.GET.200', 1, 'c')])
+        worker.flush()
+        # killed after writing a longer blob but before its header
+        worker.map[HEADER.size:HEADER.size + 8] = 'x' * 8
+        agg.add([('obj.GET.200', 1, 'c')])
+        self.assertEquals(worker.flush(), [])
+        self.assertEquals(len(logged), 1)
+        worker._elect = lambda: True
+        agg.add([('obj.GET.200', 1, 'c')])
+        # the stats published before the region got corrupted are lost,
+        # the worker's own since aren't
+        self.assertEquals(worker.flush(), ['obj.GET.200:2|c'])
+        self.assertEquals(len(logged), 1)
+
+    def test_stale_layout_discarded(self):
+        with open(self.path, 'w') as fp:
+            fp.write('\x00\x00\x00\x05hello' + '\x00' * 4087)
+        agg = Aggregator()
+        worker = SharedAggregator(agg, self.path, 4096)
+        agg.add([('obj.GET.200', 1, 'c')])
+        self.assertEquals(worker.flush(), ['obj.GET.200:1|c'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+
+from informant.sketches import SpaceSaving, HyperLogLog
+
+
+class TestSpaceSaving(unittest.TestCase):
+
+    def test_exact_under_capacity(self):
+        sketch = SpaceSaving(4)
+        for acct, count in (('a', 5), ('b', 3), ('c', 1)):
+            for i in xrange(count):
+                sketch.update(acct, nbytes=10, error=(i == 0))
+        self.assertEquals(sketch.top(2), [('a', 5, 50, 1), ('b', 3, 30, 1)])
+
+    def test_heavy_hitters_survive(self):
+        sketch = SpaceSaving(3)
+        for i in xrange(1000):
+            sketch.update('hot', 2)
+            sketch.update('warm')
+            sketch.update('cold%d' % i)
+        self.assertEquals(len(sketch.counters), 3)
+        top = sketch.top(2)
+        self.assertEquals([t[0] for t in top], ['hot', 'warm'])
+        self.assertEquals(top[0][1], 2000)
+
+    def test_replaces_least_frequent(self):
+        sketch = SpaceSaving(3)
+        for key, weight in (('a', 3), ('b', 1), ('c', 2), ('a', 1),
+                            ('b', 4), ('d', 1)):
+            sketch.update(key, weight)
+        # c was the least frequent, d inherits its count as error
+        self.assertEquals(sorted(sketch.counters), ['a', 'b', 'd'])
+        self.assertEquals(sketch.counters['d'][:2], [3, 2])
+        sketch.update('e')
+        self.assertEquals(sorted(sketch.counters), ['a', 'b', 'e'])
+        self.assertEquals(len(sketch.heap), 3)
+
+    def test_top_guaranteed_counts(self):
+        sketch = SpaceSaving(2)
+        for i in xrange(100):
+            sketch.update('a')
+            sketch.update('b')
+        sketch.update('a')
+        # cold replaces b and inherits its count as error
+        sketch.update('cold')
+        self.assertEquals(sketch.counters['cold'][:2], [101, 100])
+        self.assertEquals(sketch.top(3), [('a', 101, 0, 0),
+                                          ('cold', 1, 0, 0)])
+
+    def test_clear(self):
+        sketch = SpaceSaving(3)
+        sketch.update('a')
+        sketch.clear()
+        self.assertEquals(sketch.top(3), [])
+
+
+class TestHyperLogLog(unittest.TestCase):
+
+    def test_small_counts_exact(self):
+        hll = HyperLogLog()
+        self.assertEquals(hll.cardinality(), 0)
+        for i in xrange(3):
+            for acct in ('AUTH_a', 'AUTH_b', 'AUTH_c'):
+                hll.add(acct)
+        self.assertEquals(hll.cardinality(), 3)
+
+    def test_estimate(self):
+        hll = HyperLogLog()
+        for i in xrange(50000):
+            hll.add('AUTH_test/cont/obj%d' % i)
+        self.assertTrue(47500 < hll.cardinality() < 52500,
+                        hll.cardinality())
+        self.assertEquals(len(hll.registers), 4096)
+        hll.clear()
+        self.assertEquals(hll.cardinality(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from informant.tracer import SlowRequestTracer, SlowRequest
+
+
+def _entry(duration):
+    return SlowRequest(1331098500.0, 'tx%d' % duration, 'GET', 'obj',
+                       'AUTH_test', 200, 10, duration, 500)
+
+
+class TestSlowRequestTracer(unittest.TestCase):
+
+    def test_ring_buffer_overwrites_oldest(self):
+        tracer = SlowRequestTracer(3)
+        self.assertEquals(tracer.requests(), [])
+        for duration in xrange(1, 6):
+            tracer.record(_entry(duration))
+        self.assertEquals(len(tracer.entries), 3)
+        self.assertEquals([e.duration for e in tracer.requests()],
+                          [3, 4, 5])
+        self.assertEquals(tracer.recorded, 5)
+
+    def test_dump(self):
+        tracer = SlowRequestTracer(3)
+        tracer.record(_entry(1500))
+        dumped = json.loads(tracer.dump())
+        self.assertEquals(len(dumped), 1)
+        self.assertEquals(dumped[0]['trans_id'], 'tx1500')
+        self.assertEquals(dumped[0]['duration'], 1500)
+        self.assertEquals(dumped[0]['acct'], 'AUTH_test')
+
+    def test_dump_to_file(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'slow.json')
+            tracer = SlowRequestTracer(3)
+            tracer.record(_entry(1500))
+            tracer.dump_to_file(path)
+            with open(path) as fp:
+                self.assertEquals(fp.read(), tracer.dump())
+            self.assertEquals(os.listdir(tmpdir), ['slow.json'])
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
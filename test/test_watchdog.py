@@ -0,0 +1,57 @@
+import os
+import unittest
+
+from eventlet import spawn, sleep
+
+from informant import watchdog
+
+
+class TestHubWatchdog(unittest.TestCase):
+
+    def tearDown(self):
+        watchdog._watchdogs.clear()
+
+    def test_tick_records_lag(self):
+        dog = watchdog.HubWatchdog(0.001)
+        for i in xrange(3):
+            dog.tick()
+        lags = dog.take()
+        self.assertEquals(lags.count, 3)
+        self.assertEquals(dog.lags.count, 0)
+
+    def test_blocked_hub_lag(self):
+        dog = watchdog.HubWatchdog(0.001)
+        dog.register()
+
+        def block():
+            # a greenthread hogging the hub without yielding
+            import time
+            time.sleep(0.05)
+        spawn(block)
+        dog.tick()
+        self.assertTrue(dog.lags.max >= 40000, dog.lags.max)
+
+    def test_replaced_watchdog_stops(self):
+        started = []
+        dog = watchdog.HubWatchdog(0.001)
+        dog.register()
+        thread = spawn(dog.run, lambda: started.append(True))
+        sleep(0.01)
+        self.assertTrue(dog.running())
+        watchdog.HubWatchdog().register()
+        self.assertFalse(dog.running())
+        thread.wait()
+        self.assertEquals(started, [True])
+        self.assertTrue(dog.lags.count > 0)
+
+    def test_hub_waiting(self):
+        thread = spawn(sleep, 1)
+        sleep(0)
+        timers, fds = watchdog.hub_waiting()
+        self.assertTrue(timers >= 1, timers)
+        self.assertTrue(fds >= 0, fds)
+        thread.kill()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+from StringIO import StringIO
+
+from informant.fanout import FanOut
+from informant.wrappers import InputTimer, ResponseTimer, SubrequestTimer
+
+
+class FakeAppIter(object):
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+class TestResponseTimer(unittest.TestCase):
+
+    def test_passthrough_and_close(self):
+        app_iter = FakeAppIter(['', 'abc', 'de'])
+        timer = ResponseTimer(app_iter)
+        self.assertEquals(list(timer), ['', 'abc', 'de'])
+        self.assertEquals(timer.bytes_sent, 5)
+        self.assertTrue(timer.first_byte_time <= timer.last_byte_time)
+        timer.close()
+        self.assertTrue(app_iter.closed)
+
+    def test_closed_mid_body(self):
+        timer = ResponseTimer(FakeAppIter(['abc', 'de']))
+        self.assertEquals(timer.next(), 'abc')
+        self.assertEquals(timer.last_byte_time, None)
+        timer.close()
+        self.assertTrue(timer.last_byte_time >= timer.first_byte_time)
+
+
+class TestInputTimer(unittest.TestCase):
+
+    def test_read(self):
+        wsgi_input = InputTimer(StringIO('x' * 100))
+        self.assertEquals(wsgi_input.read(60), 'x' * 60)
+        self.assertEquals(wsgi_input.read(60), 'x' * 40)
+        self.assertEquals(wsgi_input.read(60), '')
+        self.assertEquals(wsgi_input.bytes_read, 100)
+        self.assertEquals(wsgi_input.reads, 3)
+        self.assertTrue(wsgi_input.read_time >= 0)
+        self.assertTrue(
+            wsgi_input.first_read_time <= wsgi_input.last_read_time)
+
+    def test_readline_and_iter(self):
+        wsgi_input = InputTimer(StringIO('one\ntwo\nthree\n'))
+        self.assertEquals(wsgi_input.readline(), 'one\n')
+        self.assertEquals(list(wsgi_input), ['two\n', 'three\n'])
+        self.assertEquals(wsgi_input.bytes_read, 14)
+        wsgi_input = InputTimer(StringIO('one\ntwo\n'))
+        self.assertEquals(wsgi_input.readlines(), ['one\n', 'two\n'])
+        self.assertEquals(wsgi_input.bytes_read, 8)
+        self.assertEquals(wsgi_input.reads, 1)
+
+    def test_passes_through_attributes(self):
+        wsgi_input = InputTimer(StringIO('abc'))
+        self.assertEquals(wsgi_input.getvalue(), 'abc')
+
+
+class TestSubrequestTimer(unittest.TestCase):
+
+    def test_reported_once_when_finished(self):
+        context = FanOut()
+        app_iter = FakeAppIter(['abc', 'de'])
+        timer = SubrequestTimer(app_iter, context, 'SLO', 0)
+        self.assertEquals(context.summary(), ())
+        self.assertEquals(list(timer), ['abc', 'de'])
+        timer.close()
+        self.assertTrue(app_iter.closed)
+        (source, count, duration, nbytes), = context.summary()
+        self.assertEquals((source, count, nbytes), ('SLO', 1, 5))
+        self.assertTrue(duration > 0)
+
+    def test_reported_on_close(self):
+        context = FanOut()
+        timer = SubrequestTimer(FakeAppIter(['abc', 'de']), context, 'SLO',
+                                0)
+        self.assertEquals(timer.next(), 'abc')
+        timer.close()
+        self.assertEquals(context.summary()[0][:2], ('SLO', 1))
+        self.assertEquals(context.summary()[0][3], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()